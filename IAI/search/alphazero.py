@@ -1,21 +1,33 @@
 import copy
-from game import State, Player
-from mcts import MCTS
-import random # add this line
+import time
+from game import State
+from mcts import MCTS, ArrayMCTS, MCTSPlayer
 
 
 class AlphaZero(MCTS):
     """
     A modification based on pure MCTS, replacing randomly playout with using an evaluation function.
     """
-    def __init__(self, start_state: State, evaluation_func, c=5, n_playout=10000):
+    def __init__(self, start_state: State, evaluation_func, c=5, n_playout=10000, use_candidates=False,
+                 batch_size=1, batch_evaluation_func=None, virtual_loss=1, use_symmetry=False):
         """
         Parameters:
             evaluation_func: a function taking a state as input and
                 outputs the value in the current player's perspective.
+            batch_size: the number of leaves selected before evaluating them together.
+                Paths waiting for evaluation carry a virtual loss so that the
+                following selections spread over other paths.
+            batch_evaluation_func: a function taking a list of states as input and
+                outputs their values like evaluation_func. If None, evaluation_func
+                is called on each state.
+            virtual_loss: the utility added to every node of a waiting path.
+            use_symmetry: expand a single action of every set of symmetric actions.
         """
-        super().__init__(start_state, c, n_playout)
+        super().__init__(start_state, c, n_playout, use_candidates, use_symmetry=use_symmetry)
         self.evaluation_func = evaluation_func
+        self.batch_size = batch_size
+        self.batch_evaluation_func = batch_evaluation_func
+        self.virtual_loss = virtual_loss
 
     def get_leaf_value(self, state: State):
         # TODO
@@ -34,21 +46,67 @@ class AlphaZero(MCTS):
         # 在 expand 中会以AI视角进行转换(取反)
         return value
 
+    def run_batch(self, state: State, n_left):
+        if self.batch_size <= 1:
+            return super().run_batch(state, n_left)
+        batch_size = min(self.batch_size, n_left)
+        self.playout_batch(state, batch_size)
+        return batch_size
 
-class AlphaZeroPlayer(Player):
+    def playout_batch(self, state: State, batch_size):
+        """
+        Run batch_size playouts from state (which is not modified), selecting all leaves
+        under virtual loss first and then evaluating the non-terminal ones in one call.
+        """
+        leaves, leaf_states = [], []
+        for k in range(batch_size):
+            state_copy = copy.deepcopy(state)
+            leaf = self.descend(state_copy)
+            self.add_virtual_visits(leaf, 1, self.virtual_loss)
+            leaves.append(leaf)
+            leaf_states.append(state_copy)
+
+        values = [None] * batch_size
+        pending = []
+        for k, leaf_state in enumerate(leaf_states):
+            if leaf_state.game_end()[0]:
+                values[k] = self.get_leaf_value(leaf_state)
+            else:
+                pending.append(k)
+        if pending:
+            pending_states = [leaf_states[k] for k in pending]
+            start = time.perf_counter()
+            if self.batch_evaluation_func is None:
+                pending_values = [self.evaluation_func(s) for s in pending_states]
+            else:
+                pending_values = self.batch_evaluation_func(pending_states)
+            self.stats.evaluator_time += time.perf_counter() - start
+            for k, value in zip(pending, pending_values):
+                values[k] = float(value)
+        self.stats.leaf_evals += batch_size
+        self.stats.playouts += batch_size
+
+        for leaf, value in zip(leaves, values):
+            self.add_virtual_visits(leaf, -1, -self.virtual_loss)
+            self.backup(leaf, value)
+
+
+class ArrayAlphaZero(AlphaZero, ArrayMCTS):
+    """AlphaZero on the struct-of-arrays tree of ArrayMCTS."""
+
+
+class AlphaZeroPlayer(MCTSPlayer):
     """AI player based on MCTS"""
-    def __init__(self, evaluation_func, c=5, n_playout=2000):
-        super().__init__()
+    def __init__(self, evaluation_func, c=5, n_playout=2000, use_candidates=False, reuse_tree=True,
+                 array_tree=False, n_workers=1, batch_size=1, batch_evaluation_func=None, time_ms=None,
+                 threat_search=False, use_symmetry=False):
+        super().__init__(c, n_playout, use_candidates, reuse_tree, array_tree, n_workers, time_ms=time_ms,
+                         threat_search=threat_search, use_symmetry=use_symmetry)
         self.evaluation_func = evaluation_func
-        self.c = c
-        self.n_playout = n_playout
-
-    def get_action(self, state: State):
-        mcts = AlphaZero(state, self.evaluation_func, self.c, self.n_playout)
-        # print("n_playout",self.n_playout)
-        for n in range(self.n_playout):
-            # print("n",n)
-            state_copy = copy.deepcopy(state)
-            mcts.playout(state_copy)
-        return max(mcts.root.children.items(),
-                   key=lambda act_node: act_node[1].n_visits)[0]
+        self.batch_size = batch_size
+        self.batch_evaluation_func = batch_evaluation_func
+
+    def new_search(self, state: State):
+        mcts_class = ArrayAlphaZero if self.array_tree else AlphaZero
+        return mcts_class(state, self.evaluation_func, self.c_puct, self.n_playout, self.use_candidates,
+                          self.batch_size, self.batch_evaluation_func, use_symmetry=self.use_symmetry)
@@ -0,0 +1,148 @@
+"""
+Headless tournament between two players, with games played in parallel processes
+"""
+from __future__ import print_function
+
+import copy
+import math
+import random
+import shlex
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from game import State, Player, Game
+from play import get_board, get_player, get_parser
+
+
+class TimedPlayer(Player):
+    """A player recording the time taken by each get_action of another player."""
+    def __init__(self, player: Player):
+        super().__init__()
+        self.inner = player
+        self.move_times = []
+
+    def set_player(self, p):
+        super().set_player(p)
+        self.inner.set_player(p)
+
+    def get_action(self, state: State):
+        start = time.perf_counter()
+        action = self.inner.get_action(state)
+        self.move_times.append(time.perf_counter() - start)
+        return action
+
+    def get_stats(self):
+        return self.inner.get_stats()
+
+    def new_stats(self, state: State):
+        return self.inner.new_stats(state)
+
+    def ponder(self, state: State, stop_event):
+        self.inner.ponder(state, stop_event)
+
+    def close(self):
+        self.inner.close()
+
+    def __str__(self):
+        return str(self.inner)
+
+
+def get_player_args(args, options):
+    """Return a copy of args with the command line options of one player (e.g. "--n_playout 200") applied."""
+    return get_parser().parse_args(shlex.split(options), namespace=copy.copy(args))
+
+
+def play_game(args, game_index):
+    """
+    Play game game_index of the tournament. Player 1 moves first in even games and
+    player 2 in odd ones, and the random generators are seeded with args.seed + game_index.
+
+    Return: the result for player 1 (1 for a win, 0.5 for a tie and 0 for a loss) and
+        the times of the moves of both players in seconds.
+    """
+    seed = args.seed + game_index
+    random.seed(seed)
+    np.random.seed(seed % (1 << 32))
+    board = get_board(args.board, args)
+    player_1 = TimedPlayer(get_player(args.player_1, get_player_args(args, args.options_1)))
+    player_2 = TimedPlayer(get_player(args.player_2, get_player_args(args, args.options_2)))
+    try:
+        winner = Game(board).start_play(player_1, player_2, start_player=game_index % 2, is_shown=0,
+                                    show_stats=args.show_stats)
+    finally:
+        player_1.close()
+        player_2.close()
+    if winner == -1:
+        result = 0.5
+    else:
+        result = 1. if winner == player_1.player else 0.
+    return result, player_1.move_times, player_2.move_times
+
+
+def elo_difference(score):
+    """The Elo difference giving an expected score of score, infinite for 0 or 1."""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+def report(args, results, times_1, times_2, seconds):
+    n_games = len(results)
+    results = np.array(results)
+    n_wins, n_draws = int(np.sum(results == 1)), int(np.sum(results == 0.5))
+    n_losses = n_games - n_wins - n_draws
+    score = results.mean()
+    # Wilson interval of the score, which unlike the normal approximation does not shrink to a point
+    # when every game has the same result. One of its ends is then exactly 0 or 1, an infinite Elo
+    # difference, so only the finite side is printed
+    z = 1.96
+    center = (score + z * z / (2 * n_games)) / (1 + z * z / n_games)
+    margin = z / (1 + z * z / n_games) * math.sqrt(score * (1 - score) / n_games + z * z / (4 * n_games * n_games))
+    lower, upper = center - margin, center + margin
+    if score == 0:
+        elo = "< {:.1f} (95% CI)".format(elo_difference(upper))
+    elif score == 1:
+        elo = "> {:.1f} (95% CI)".format(elo_difference(lower))
+    else:
+        elo = "{:.1f} (95% CI {:.1f} to {:.1f})".format(elo_difference(score), elo_difference(lower),
+                                                      elo_difference(upper))
+    name_1 = "Player 1 ({})".format(" ".join([args.player_1, args.options_1]).strip())
+    name_2 = "Player 2 ({})".format(" ".join([args.player_2, args.options_2]).strip())
+    print("{} vs {}, {} games".format(name_1, name_2, n_games))
+    print("W/D/L of player 1: {}/{}/{}, score {:.3f}".format(n_wins, n_draws, n_losses, score))
+    print("Elo difference of player 1: {}".format(elo))
+    print("{:.2f} games/s ({:.1f} s)".format(n_games / seconds, seconds))
+    for name, times in ((name_1, times_1), (name_2, times_2)):
+        if times:
+            print("{}: {} moves, mean {:.1f} ms, p95 {:.1f} ms per move".format(
+                name, len(times), 1000 * np.mean(times), 1000 * np.percentile(times, 95)))
+
+
+def run(args):
+    start = time.time()
+    results, times_1, times_2 = [], [], []
+    if args.n_processes > 1:
+        with ProcessPoolExecutor(args.n_processes) as pool:
+            games = list(pool.map(play_game, [args] * args.n_games, range(args.n_games)))
+    else:
+        games = [play_game(args, k) for k in range(args.n_games)]
+    for result, move_times_1, move_times_2 in games:
+        results.append(result)
+        times_1.extend(move_times_1)
+        times_2.extend(move_times_2)
+    report(args, results, times_1, times_2, time.time() - start)
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    parser.add_argument("--n_games", type=int, default=10, help="Number of games, the first move alternating between the players.")
+    parser.add_argument("--n_processes", type=int, default=1, help="Processes playing games in parallel.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generators of the first game, increased by one every game.")
+    parser.add_argument("--options_1", type=str, default="", help='Options of play.py overridden for player 1, given with "=", e.g. --options_1="--n_playout 200 --c 0.5".')
+    parser.add_argument("--options_2", type=str, default="", help="Options of play.py overridden for player 2.")
+    args = parser.parse_args()
+
+    run(args)
@@ -0,0 +1,219 @@
+"""
+Benchmark of the search players over a fixed corpus of positions
+"""
+from __future__ import print_function
+
+import json
+import platform
+import random
+import subprocess
+import time
+
+import numpy as np
+from game import Board, ArrayBoard
+from minimax import MinimaxSearchPlayer, AlphaBetaSearchPlayer, CuttingOffAlphaBetaSearchPlayer, \
+    PrincipalVariationSearchPlayer
+from mcts import MCTSPlayer
+from alphazero import AlphaZeroPlayer
+from evaluation import get_evaluation_func, get_batch_evaluation_func
+
+
+# (name, kind, width, height, n_in_row, moves played from the empty board, best moves or None if unknown)
+# The best moves of the small boards were found by exhaustive search.
+POSITIONS = [
+    ("3x3-empty", "opening", 3, 3, 3, [], None),
+    ("9x9-center", "opening", 9, 9, 5, [40], None),
+    ("9x9-three-stones", "opening", 9, 9, 5, [40, 41, 30], None),
+    ("3x3-block", "midgame", 3, 3, 3, [4, 0, 2], [6]),
+    ("6x6-midgame", "midgame", 6, 6, 4, [14, 15, 21, 20, 8, 27], None),
+    ("9x9-midgame", "midgame", 9, 9, 5, [40, 41, 31, 49, 32, 30, 50, 22, 48, 39, 42, 58], None),
+    ("3x3-win-in-1", "forced_win", 3, 3, 3, [0, 3, 1, 4], [2]),
+    ("4x3-empty", "forced_win", 4, 3, 3, [], [0, 1, 2, 3, 5, 6, 8, 9, 10, 11]),
+    ("4x4-two-stones", "forced_win", 4, 4, 3, [5, 6], [2, 8, 9, 10]),
+    ("9x9-win-before-block", "forced_win", 9, 9, 5, [40, 39, 41, 49, 42, 50, 43, 51, 10, 52], [44]),
+    ("9x9-open-three", "forced_win", 9, 9, 5, [40, 0, 41, 8, 42, 72], [39, 43]),
+]
+
+
+class NodeCounting(object):
+    """Board mixin counting the actions performed on a board and all its copies."""
+    def perform_action(self, action):
+        self.node_count[0] += 1
+        return super().perform_action(action)
+
+
+class CountingBoard(NodeCounting, Board):
+    pass
+
+
+class CountingArrayBoard(NodeCounting, ArrayBoard):
+    pass
+
+
+def get_position(position, board_name="Board"):
+    name, kind, width, height, n_in_row, moves, best = position
+    board_class = CountingArrayBoard if board_name == "ArrayBoard" else CountingBoard
+    board = board_class(width=width, height=height, n_in_row=n_in_row)
+    board.reset()
+    board.node_count = [0]
+    for move in moves:
+        board.perform_action(move)
+    board.node_count[0] = 0
+    return board
+
+
+def get_configs(args):
+    """
+    Return the benchmarked players as a list of (name, depth or None, function building
+    the player, the largest board in cells it is run on).
+    """
+    evaluation_func = get_evaluation_func(args.evaluation_func)
+    batch_evaluation_func = get_batch_evaluation_func(args.evaluation_func)
+    # the exhaustive searches are only run on the small boards
+    configs = [("MinimaxSearchPlayer", None, lambda: MinimaxSearchPlayer(), 9),
+               ("AlphaBetaSearchPlayer", None, lambda: AlphaBetaSearchPlayer(), 16)]
+    for depth in range(1, args.max_depth + 1):
+        configs.append(("CuttingOffAlphaBetaSearchPlayer(max_depth={})".format(depth), depth,
+                        lambda depth=depth: CuttingOffAlphaBetaSearchPlayer(depth, evaluation_func,
+                                                                            use_candidates=True), None))
+    for depth in range(1, args.max_depth + 1):
+        configs.append(("PrincipalVariationSearchPlayer(max_depth={})".format(depth), depth,
+                        lambda depth=depth: PrincipalVariationSearchPlayer(depth, evaluation_func,
+                                                                           use_candidates=True), None))
+    configs.append(("MCTSPlayer(n_playout={})".format(args.n_playout), None,
+                    lambda: MCTSPlayer(args.c, args.n_playout, use_candidates=True, reuse_tree=False), None))
+    configs.append(("AlphaZeroPlayer(n_playout={})".format(args.n_playout), None,
+                    lambda: AlphaZeroPlayer(evaluation_func, args.c, args.n_playout, use_candidates=True,
+                                            reuse_tree=False, batch_evaluation_func=batch_evaluation_func),
+                    None))
+    return configs
+
+
+def run_position(name, depth, make_player, position, args):
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    board = get_position(position, args.board)
+    player = make_player()
+    player.set_player(board.get_current_player())
+    start = time.perf_counter()
+    move = player.get_action(board)
+    seconds = time.perf_counter() - start
+    player.close()
+    nodes = board.node_count[0]
+    best = position[-1]
+    result = {"player": name, "position": position[0], "kind": position[1], "seconds": seconds,
+              "nodes": nodes, "nodes_per_s": nodes / seconds, "move": int(move),
+              "agree": None if best is None else int(move) in best}
+    if depth is not None:
+        result["depth"] = depth
+    if isinstance(player, MCTSPlayer):
+        result["playouts"] = player.completed_playouts
+        result["playouts_per_s"] = player.completed_playouts / seconds
+    return result
+
+
+def summarize(results):
+    """Totals of the results of every player over the corpus."""
+    summary = {}
+    for result in results:
+        s = summary.setdefault(result["player"], {"seconds": 0., "nodes": 0, "n_best_known": 0, "n_agree": 0})
+        s["seconds"] += result["seconds"]
+        s["nodes"] += result["nodes"]
+        if "playouts" in result:
+            s["playouts"] = s.get("playouts", 0) + result["playouts"]
+        if "depth" in result:
+            s["depth"] = result["depth"]
+        if result["agree"] is not None:
+            s["n_best_known"] += 1
+            s["n_agree"] += result["agree"]
+    for s in summary.values():
+        s["nodes_per_s"] = s["nodes"] / s["seconds"]
+        if "playouts" in s:
+            s["playouts_per_s"] = s["playouts"] / s["seconds"]
+        s["agreement"] = s["n_agree"] / s["n_best_known"] if s["n_best_known"] > 0 else None
+    # time to reach each depth over the whole corpus, for every depth-limited player
+    time_to_depth = {}
+    for name, s in summary.items():
+        if "depth" in s:
+            time_to_depth.setdefault(name.split("(")[0], {})[s["depth"]] = s["seconds"]
+    return summary, time_to_depth
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """Print the speed ratios and the changed moves against a baseline report, over the runs in both."""
+    print("Against {} ({}):".format(baseline.get("commit"), baseline.get("date")))
+    old_results = {(r["player"], r["position"]): r for r in baseline["results"]}
+    totals = {}
+    for r in report["results"]:
+        old = old_results.get((r["player"], r["position"]))
+        if old is None:
+            continue
+        t = totals.setdefault(r["player"], [0, 0., 0, 0.])
+        t[0] += r["nodes"]
+        t[1] += r["seconds"]
+        t[2] += old["nodes"]
+        t[3] += old["seconds"]
+        if old["move"] != r["move"]:
+            print("{} on {}: move {} instead of {}".format(r["player"], r["position"], r["move"], old["move"]))
+    for name, (nodes, seconds, old_nodes, old_seconds) in totals.items():
+        print("{:48s} nodes/s x{:.2f}, time x{:.2f}".format(
+            name, (nodes / seconds) / (old_nodes / old_seconds), seconds / old_seconds))
+
+
+def run(args):
+    positions = [p for p in POSITIONS if args.kind is None or p[1] == args.kind]
+    results = []
+    for name, depth, make_player, max_cells in get_configs(args):
+        if args.players and not any(name.startswith(p) for p in args.players.split(",")):
+            continue
+        for position in positions:
+            if max_cells is not None and position[2] * position[3] > max_cells:
+                continue
+            result = run_position(name, depth, make_player, position, args)
+            results.append(result)
+            print("{:48s} {:22s} {:8.3f} s {:10.0f} nodes/s  move {:3d}{}".format(
+                name, result["position"], result["seconds"], result["nodes_per_s"], result["move"],
+                "" if result["agree"] is None else " ok" if result["agree"] else " WRONG"))
+    summary, time_to_depth = summarize(results)
+    print()
+    for name, s in summary.items():
+        print("{:48s} {:8.3f} s {:10.0f} nodes/s{}{}".format(
+            name, s["seconds"], s["nodes_per_s"],
+            "" if "playouts" not in s else " {:8.0f} playouts/s".format(s["playouts_per_s"]),
+            "" if s["agreement"] is None else "  agreement {}/{}".format(s["n_agree"], s["n_best_known"])))
+    report = {"commit": get_commit(), "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "python": platform.python_version(), "board": args.board, "seed": args.seed,
+              "summary": summary, "time_to_depth": time_to_depth, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, default=None, help="JSON file to write the results to.")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON file of an earlier run to compare with.")
+    parser.add_argument("--players", type=str, default=None, help="Comma-separated prefixes of the benchmarked players, all by default.")
+    parser.add_argument("--kind", type=str, default=None, help="Only the positions of this kind (opening, midgame or forced_win).")
+    parser.add_argument("--board", type=str, default="Board", help="Board representation (Board or ArrayBoard).")
+    parser.add_argument("--max_depth", type=int, default=2, help="Deepest CuttingOffAlphaBetaSearch and PrincipalVariationSearch benchmarked.")
+    parser.add_argument("--evaluation_func", type=str, default="detailed_evaluation_func", help="Evaluation function (CuttingOffAlphaBetaSearch/AlphaZero).")
+    parser.add_argument("--c", type=float, default=0.2, help="Trade-off hyperparameter (MCTS/AlphaZero).")
+    parser.add_argument("--n_playout", type=int, default=500, help="Number of playouts (MCTS/AlphaZero).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generators before every search.")
+    args = parser.parse_args()
+
+    run(args)
@@ -1,6 +1,11 @@
 """
 Evaluation functions
 """
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from game import batch_get_info
 
 
 def dummy_evaluation_func(state):
@@ -54,12 +59,171 @@ def detailed_evaluation_func(state):
     return score
 
 
-def get_evaluation_func(func_name):
+def _batch_info(states):
+    """get_info of a list of boards in one batch_get_info call, split into the
+    shapes of the player to move (mine) and of the opponent (theirs)."""
+    players = np.array([s.get_current_player() for s in states])
+    info = batch_get_info(np.stack([s.to_array() for s in states]))
+    p1, p2 = sorted(info)
+    mine = {key: np.where(players == p1, info[p1][key], info[p2][key]) for key in info[p1]}
+    theirs = {key: np.where(players == p1, info[p2][key], info[p1][key]) for key in info[p1]}
+    return mine, theirs
+
+
+def batch_dummy_evaluation_func(states):
+    return np.zeros(len(states))
+
+
+def batch_distance_evaluation_func(states):
+    mine, theirs = _batch_info(states)
+    return theirs["max_distance"] - mine["max_distance"]
+
+
+def batch_detailed_evaluation_func(states):
+    """detailed_evaluation_func of a list of states, returned as an array."""
+    mine, theirs = _batch_info(states)
+    score = (-mine["max_distance"] + mine["live_three"] * 15 + mine["three"] * 2 + mine["live_two"] * 3
+             + theirs["max_distance"] - theirs["four"] * 16 - theirs["live_three"] * 14
+             - theirs["three"] * 3 - theirs["live_two"] * 5)
+    will_win = (mine["live_four"] > 0) | (mine["four"] > 0)
+    will_loss = theirs["live_four"] > 0
+    score = np.where(will_win, 99, np.where(will_loss, -100, score))
+    return score / 100
+
+
+class CachedEvaluation(object):
+    """
+    An evaluation function remembering the values of the last positions it evaluated.
+
+    Positions are keyed by state.get_hash(), which covers the player to move, so the
+    cache can be shared by both players and kept across playouts, moves and games
+    on boards of the same size. The least recently used position is evicted when
+    the cache is full. The table is guarded by a lock, as a pondering player searches
+    in a thread while its opponent uses the same cache.
+    """
+    def __init__(self, evaluation_func, size=1 << 16, batch_evaluation_func=None, canonical=False):
+        """
+        Parameters:
+            evaluation_func: the evaluation function to cache.
+            size: the maximum number of positions kept.
+            batch_evaluation_func: the version of evaluation_func taking a list of
+                states, used by evaluate_batch for the positions not in the cache.
+            canonical: key positions by state.get_canonical_hash() instead, sharing the
+                value of positions equal up to a symmetry of the board (the evaluation
+                function must give them the same value).
+        """
+        self.evaluation_func = evaluation_func
+        self.size = size
+        self.batch_evaluation_func = batch_evaluation_func
+        self.canonical = canonical
+        self.table = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # processes of parallel search start with an empty cache
+        d = self.__dict__.copy()
+        d["table"] = OrderedDict()
+        del d["lock"]
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        with self.lock:
+            value = self.table.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.table.move_to_end(key)
+        return value
+
+    def _put(self, key, value):
+        with self.lock:
+            self.table[key] = value
+            if len(self.table) > self.size:
+                self.table.popitem(last=False)
+
+    def _key(self, state):
+        return state.get_canonical_hash()[0] if self.canonical else state.get_hash()
+
+    def __call__(self, state):
+        key = self._key(state)
+        value = self._get(key)
+        if value is None:
+            value = self.evaluation_func(state)
+            self._put(key, value)
+        return value
+
+    def evaluate_batch(self, states):
+        """Evaluate a list of states like batch_evaluation_func, returning an array."""
+        keys = [self._key(s) for s in states]
+        values = np.array([self._get(key) for key in keys], dtype=np.float64)
+        missing = np.flatnonzero(np.isnan(values))
+        if len(missing) > 0:
+            missing_states = [states[k] for k in missing]
+            if self.batch_evaluation_func is None:
+                values[missing] = [self.evaluation_func(s) for s in missing_states]
+            else:
+                values[missing] = self.batch_evaluation_func(missing_states)
+            for k in missing:
+                self._put(keys[k], float(values[k]))
+        return values
+
+    def hit_rate(self):
+        n = self.hits + self.misses
+        return self.hits / n if n > 0 else 0.0
+
+    def clear(self):
+        self.table.clear()
+        self.hits, self.misses = 0, 0
+
+    def __str__(self):
+        return "{} positions, {} hits, {} misses, hit rate {:.1%}".format(
+            len(self.table), self.hits, self.misses, self.hit_rate())
+
+
+def get_evaluation_func(func_name, cache_size=0, canonical=False, weights=None):
+    """
+    Return the evaluation function func_name, wrapped in a CachedEvaluation of
+    cache_size positions (keyed by canonical position if canonical) if cache_size > 0.
+    weights is the file of value_net_evaluation_func (value_net.DEFAULT_WEIGHTS if None).
+    """
     if func_name == "dummy_evaluation_func":
-        return dummy_evaluation_func
+        evaluation_func = dummy_evaluation_func
     elif func_name == "distance_evaluation_func":
-        return distance_evaluation_func
+        evaluation_func = distance_evaluation_func
     elif func_name == "detailed_evaluation_func":
-        return detailed_evaluation_func
+        evaluation_func = detailed_evaluation_func
+    elif func_name == "value_net_evaluation_func":
+        # joelnet is only needed by this one
+        from value_net import load_value_net
+        evaluation_func = load_value_net(weights)
     else:
         raise KeyError(func_name)
+    if cache_size > 0:
+        return CachedEvaluation(evaluation_func, cache_size, get_batch_evaluation_func(func_name, weights),
+                                canonical)
+    return evaluation_func
+
+
+def get_batch_evaluation_func(func_name, weights=None):
+    """
+    Return the version of an evaluation function taking a list of states and returning
+    an array of values, or None if it has none (it is then called state by state).
+    """
+    if func_name == "dummy_evaluation_func":
+        return batch_dummy_evaluation_func
+    elif func_name == "distance_evaluation_func":
+        return batch_distance_evaluation_func
+    elif func_name == "detailed_evaluation_func":
+        return batch_detailed_evaluation_func
+    elif func_name == "value_net_evaluation_func":
+        from value_net import load_value_net
+        return load_value_net(weights).evaluate_batch
+    else:
+        return None
@@ -1,8 +1,13 @@
+import math
 import random
+import time
 
 import copy
 import numpy as np
-from game import State, Player
+from concurrent.futures import ProcessPoolExecutor
+from game import State, Player, SearchStats
+from rollout import batch_rollout
+from threat import ThreatSearch
 
 from copy import deepcopy
 
@@ -11,17 +16,38 @@ class TreeNode(object):
     """A node in the MCTS tree. Each node keeps track of its total utility U, and its visit-count n_visit.
     """
 
-    def __init__(self, parent, state: State):
+    def __init__(self, parent, state: State, use_candidates=False, use_symmetry=False, rave=False):
         """
         Parameters:
             parent (TreeNode | None): the parent node of the new node.
             state (State): the state corresponding to the new node.
+            use_candidates (bool): only expand the actions near existing stones
+                (state.get_candidate_actions()) instead of all actions.
+            use_symmetry (bool): expand one action of every set of actions leading to
+                positions equal up to a symmetry of the board (state.get_unique_actions),
+                so that they share one child.
+            rave (bool): keep the AMAF statistics of the actions for select_rave.
         """
         self.parent = parent
-        self.actions = deepcopy(state.get_all_actions())  # a list of all actions
+        self.use_candidates = use_candidates
+        self.use_symmetry = use_symmetry
+        self.rave = rave
+        if use_candidates:
+            self.actions = state.get_candidate_actions()  # a list of candidate actions
+        else:
+            self.actions = deepcopy(state.get_all_actions())  # a list of all actions
+        if use_symmetry:
+            self.actions = state.get_unique_actions(self.actions)
         self.children = {}  # a map from action to TreeNode
         self.n_visits = 0
         self.U = 0  # total utility
+        if rave:
+            # in random order, so that select_rave breaks ties at random
+            self.actions = random.sample(self.actions, len(self.actions))
+            # action -> the number of playouts in which the current player played it, and their total
+            # utility in the current player's perspective
+            self.amaf_visits = {}
+            self.amaf_U = {}
 
     def expand(self, action, next_state):
         """
@@ -32,7 +58,7 @@ class TreeNode(object):
             next_state: the state corresponding to the child.
         """
         # TODO
-        self.children[action] = TreeNode(self,next_state)
+        self.children[action] = TreeNode(self, next_state, self.use_candidates, self.use_symmetry, self.rave)
 
     def get_ucb(self, c):
         """Calculate and return the ucb value for this node in the parent's perspective.
@@ -65,6 +91,48 @@ class TreeNode(object):
                 next_node = child
         return action, next_node
 
+    def get_rave_value(self, action, c, k):
+        """
+        Calculate the value of action in RAVE mode: the mean utility of its child blended with its
+        AMAF value, the weight beta = sqrt(k / (3 n + k)) of the AMAF value going to 0 as the
+        number of visits n of the child grows, plus the UCB exploration term.
+        An action that is not expanded yet only has its AMAF value.
+
+        Parameters:
+            c: the trade-off hyperparameter.
+            k: the number of visits for which both values have the same weight (equivalence parameter).
+        """
+        child = self.children.get(action)
+        n = 0 if child is None else child.n_visits
+        n_amaf = self.amaf_visits.get(action, 0)
+        value = - child.U / n if n > 0 else 0.
+        amaf_value = self.amaf_U[action] / n_amaf if n_amaf > 0 else 0.
+        beta = math.sqrt(k / (3 * n + k))
+        return (1 - beta) * value + beta * amaf_value + c * math.sqrt(math.log(self.n_visits + 1) / (n + 1))
+
+    def select_rave(self, c, k):
+        """
+        Select the action, expanded or not, that gives maximum RAVE value (see get_rave_value).
+
+        Return: the action.
+        """
+        return max(self.actions, key=lambda action: self.get_rave_value(action, c, k))
+
+    def update_amaf(self, cells, player, leaf_value):
+        """
+        Update the AMAF statistics from the final board of a playout.
+
+        Parameters:
+            cells: the pieces of the final board, indexed by action.
+            player: the current player.
+            leaf_value: the value of the playout in the current player's perspective.
+        """
+        for action in self.actions:
+            # stones are never removed, so an action now taken by player was played by player
+            if cells[action] == player:
+                self.amaf_visits[action] = self.amaf_visits.get(action, 0) + 1
+                self.amaf_U[action] = self.amaf_U.get(action, 0.) + leaf_value
+
     def update(self, leaf_value):
         """
         Update node values from leaf evaluation.
@@ -91,25 +159,119 @@ class TreeNode(object):
 class MCTS(object):
     """A simple implementation of Monte Carlo Tree Search."""
 
-    def __init__(self, start_state: State, c=5, n_playout=10000):
+    def __init__(self, start_state: State, c=5, n_playout=10000, use_candidates=False, n_rollout=0,
+                 use_symmetry=False, rave_equivalence=0):
         """
         Parameters:
             c: the hyperparameter in the UCB value.
             n_playout: the number of total playouts.
+            use_candidates: only expand the actions near existing stones.
+            n_rollout: if positive, the leaf value is the mean result of n_rollout random
+                games played at once on NumPy boards (see rollout.batch_rollout) instead
+                of one random game played move by move.
+            use_symmetry: expand a single action of every set of symmetric actions.
+            rave_equivalence: if positive, select children with RAVE (rapid action value
+                estimation): the all-moves-as-first (AMAF) statistics of every playout are kept
+                at the nodes on its path and blended into selection, with rave_equivalence
+                as the equivalence parameter k of TreeNode.get_rave_value. Actions are then
+                no longer all expanded before the first selection.
         """
         self.start_state = start_state
-        self.root = TreeNode(None, start_state)
+        self.root = TreeNode(None, start_state, use_candidates, use_symmetry, rave_equivalence > 0)
         self.c = c
         self.n_playout = n_playout
+        self.n_rollout = n_rollout
+        self.rave_equivalence = rave_equivalence
+        self.stats = SearchStats()
 
-    def playout(self, state: State):
+    def get_root_visits(self):
+        """Return a dict from every expanded action at the root to its visit count."""
+        return {action: node.n_visits for action, node in self.root.children.items()}
+
+    def get_root_stats(self):
+        """Return a dict from every expanded action at the root to (n_visits, U) of its child."""
+        return {action: (node.n_visits, node.U) for action, node in self.root.children.items()}
+
+    def get_tree_size(self):
+        """Return the number of nodes in the tree under the root."""
+        size, nodes = 0, [self.root]
+        while nodes:
+            node = nodes.pop()
+            size += 1
+            nodes.extend(node.children.values())
+        return size
+
+    def update_with_move(self, action):
         """
-        Run a single playout from the root to the leaf, getting a value at
-        the leaf and propagating it back through its parents.
-        State is modified in-place, so a copy must be provided.
+        Make the child reached by action the new root, keeping its subtree.
+
+        Return: whether the child exists, if not the tree is left unchanged.
+        """
+        if action not in self.root.children:
+            return False
+        self.root = self.root.children[action]
+        self.root.parent = None
+        return True
+
+    def run(self, state: State, n_playout, time_ms=None):
+        """
+        Run n_playout playouts from state, which is not modified.
+
+        With time_ms (anytime mode), stop when time_ms milliseconds have passed, or when
+        the most visited root child can no longer be overtaken by the playouts left before
+        the deadline (estimated from the speed so far) or before n_playout. n_playout may
+        then be None for no limit.
+
+        Return: the number of playouts run.
+        """
+        # the lines changed since the last search are scored once here instead of in every playout
+        state.update_info()
+        n_done = 0
+        if time_ms is None:
+            while n_done < n_playout:
+                n_done += self.run_batch(state, n_playout - n_done)
+            return n_done
+        start = time.time()
+        deadline = start + time_ms / 1000
+        while n_playout is None or n_done < n_playout:
+            n_left = float("inf") if n_playout is None else n_playout - n_done
+            n_done += self.run_batch(state, n_left)
+            now = time.time()
+            if now >= deadline:
+                break
+            n_left = min(n_left, n_done / max(now - start, 1e-9) * (deadline - now))
+            visits = sorted(self.get_root_visits().values(), reverse=True) + [0, 0]
+            if visits[0] - visits[1] > n_left:
+                break
+        return n_done
+
+    def run_batch(self, state: State, n_left):
+        """
+        Run one step of run, at most n_left playouts from state.
+
+        Return: the number of playouts run.
+        """
+        self.playout(copy.deepcopy(state))
+        return 1
+
+    def descend(self, state: State):
+        """
+        Select from the root down to a node with unexpanded actions, expand one of them
+        and return the new node (or the terminal node reached), performing the actions on state.
         """
         node = self.root
+        depth = 0
         while not state.game_end()[0]:
+            depth += 1
+            if self.rave_equivalence > 0:
+                action = node.select_rave(self.c, self.rave_equivalence)
+                state.perform_action(action)
+                if action not in node.children:
+                    node.expand(action, state)
+                    node = node.children[action]
+                    break
+                node = node.children[action]
+                continue
             unexpanded_actions = node.get_unexpanded_actions()
             if len(unexpanded_actions) > 0:
                 action = random.choice(unexpanded_actions)
@@ -121,10 +283,58 @@ class MCTS(object):
                 # Greedily select next move.
                 action, node = node.select(self.c)
                 state.perform_action(action)
+        self.stats.add_path(depth)
+        return node
+
+    def backup(self, leaf, leaf_value):
+        """Update value and visit count of the nodes from leaf to the root."""
+        leaf.update_recursive(leaf_value)
 
+    def backup_amaf(self, leaf, player, state: State, leaf_value):
+        """
+        Update the AMAF statistics of the nodes from leaf to the root with a playout
+        ending in state (after the rollout, or at the leaf if it was not played move by move).
+
+        Parameters:
+            player: the current player at the leaf.
+            leaf_value: the value of the playout in player's perspective.
+        """
+        cells = state.to_array().reshape(-1).tolist()
+        p1, p2 = state._players
+        node = leaf
+        while node is not None:
+            node.update_amaf(cells, player, leaf_value)
+            node, player, leaf_value = node.parent, (p2 if player == p1 else p1), -leaf_value
+
+    def add_virtual_visits(self, leaf, n_visits, U):
+        """
+        Add n_visits and utility U to every node from leaf to the root without flipping
+        the sign, i.e. as a result for the player choosing each of them. A positive U makes
+        the path look lost (virtual loss) while its leaf is waiting for evaluation.
+        """
+        node = leaf
+        while node is not None:
+            node.n_visits += n_visits
+            node.U += U
+            node = node.parent
+
+    def playout(self, state: State):
+        """
+        Run a single playout from the root to the leaf, getting a value at
+        the leaf and propagating it back through its parents.
+        State is modified in-place, so a copy must be provided.
+        """
+        leaf = self.descend(state)
+        player = state.get_current_player()
+        start = time.perf_counter()
         leaf_value = self.get_leaf_value(state)
+        self.stats.evaluator_time += time.perf_counter() - start
+        self.stats.leaf_evals += 1
+        self.stats.playouts += 1
         # Update value and visit count of nodes in this traversal.
-        node.update_recursive(leaf_value)
+        self.backup(leaf, leaf_value)
+        if self.rave_equivalence > 0:
+            self.backup_amaf(leaf, player, state, leaf_value)
 
     def get_leaf_value(self, state: State):
         """
@@ -143,6 +353,9 @@ class MCTS(object):
                 value = 0
             else:
                 value = (1 if winner == player else -1)
+        elif self.n_rollout > 0:
+            value = float(batch_rollout(state.to_array(), player, state._players, state._n_in_row,
+                                        self.n_rollout).mean())
         else:
             while not end:
                 action = random.choice(state.get_all_actions())
@@ -155,17 +368,354 @@ class MCTS(object):
         return value
 
 
+class ArrayMCTS(MCTS):
+    """
+    MCTS storing the tree as a struct of preallocated arrays instead of TreeNode objects.
+
+    Node i has n_visits[i], U[i], parent[i] and the action leading to it action[i].
+    The children of a node are allocated together, in random order, the first time
+    one of them is expanded: they are nodes first_child[i] to first_child[i] + n_children[i] - 1,
+    and the first n_expanded[i] of them are in the tree. Selection computes the UCB value
+    of all children in one vector operation. In RAVE mode, child i also has the AMAF
+    statistics amaf_visits[i] and amaf_U[i] in its parent's perspective.
+    """
+
+    def __init__(self, start_state: State, c=5, n_playout=10000, use_candidates=False, n_rollout=0,
+                 use_symmetry=False, rave_equivalence=0, capacity=1 << 12):
+        """
+        Parameters:
+            c: the hyperparameter in the UCB value.
+            n_playout: the number of total playouts.
+            use_candidates: only expand the actions near existing stones.
+            n_rollout: the number of random games per leaf, see MCTS.
+            use_symmetry: expand a single action of every set of symmetric actions.
+            rave_equivalence: select children with RAVE if positive, see MCTS.
+            capacity: the number of nodes to allocate at first, doubled when it runs out.
+        """
+        # the TreeNode root of MCTS.__init__ is not needed
+        self.start_state = start_state
+        self.c = c
+        self.n_playout = n_playout
+        self.n_rollout = n_rollout
+        self.rave_equivalence = rave_equivalence
+        self.stats = SearchStats()
+        self.use_candidates = use_candidates
+        self.use_symmetry = use_symmetry
+        self.n_visits = np.zeros(capacity, dtype=np.int64)
+        self.U = np.zeros(capacity, dtype=np.float64)
+        self.amaf_visits = np.zeros(capacity, dtype=np.int64)
+        self.amaf_U = np.zeros(capacity, dtype=np.float64)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.action = np.full(capacity, -1, dtype=np.int32)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.n_children = np.zeros(capacity, dtype=np.int32)
+        self.n_expanded = np.zeros(capacity, dtype=np.int32)
+        self.size = 1
+        self.root = 0
+
+    def _allocate_children(self, node, state: State):
+        if self.use_candidates:
+            actions = state.get_candidate_actions()
+        else:
+            actions = list(state.get_all_actions())
+        if self.use_symmetry:
+            actions = state.get_unique_actions(actions)
+        random.shuffle(actions)
+        n = len(actions)
+        if self.size + n > len(self.n_visits):
+            self._grow(self.size + n)
+        first = self.size
+        self.size += n
+        self.action[first:first + n] = actions
+        self.parent[first:first + n] = node
+        self.first_child[node] = first
+        self.n_children[node] = n
+
+    def _grow(self, size):
+        capacity = len(self.n_visits)
+        while capacity < size:
+            capacity *= 2
+        for name, fill in (("n_visits", 0), ("U", 0), ("amaf_visits", 0), ("amaf_U", 0), ("parent", -1),
+                           ("action", -1), ("first_child", -1), ("n_children", 0), ("n_expanded", 0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def select(self, node):
+        """Return the child of node with maximum UCB value in the parent's perspective."""
+        first = self.first_child[node]
+        last = first + self.n_children[node]
+        n_visits = self.n_visits[first:last]
+        ucb = -self.U[first:last] / n_visits + self.c * np.sqrt(np.log(self.n_visits[node]) / n_visits)
+        return first + int(np.argmax(ucb))
+
+    def select_rave(self, node):
+        """
+        Return the child of node, expanded or not, with maximum RAVE value (see TreeNode.get_rave_value),
+        moving it among the expanded children if it was not.
+        """
+        first = self.first_child[node]
+        last = first + self.n_children[node]
+        k = self.rave_equivalence
+        n_visits = self.n_visits[first:last]
+        amaf_visits = self.amaf_visits[first:last]
+        value = np.where(n_visits > 0, -self.U[first:last] / np.maximum(n_visits, 1), 0.)
+        amaf_value = np.where(amaf_visits > 0, self.amaf_U[first:last] / np.maximum(amaf_visits, 1), 0.)
+        beta = np.sqrt(k / (3 * n_visits + k))
+        rave = (1 - beta) * value + beta * amaf_value + self.c * np.sqrt(np.log(self.n_visits[node] + 1) / (n_visits + 1))
+        child = first + int(np.argmax(rave))
+        expanded = first + self.n_expanded[node]
+        if child >= expanded:
+            # children not expanded yet have no statistics but their action and AMAF ones
+            for array in (self.action, self.amaf_visits, self.amaf_U):
+                array[child], array[expanded] = array[expanded], array[child]
+            self.n_expanded[node] += 1
+            child = expanded
+        return child
+
+    def descend(self, state: State):
+        """Like MCTS.descend, but return the array of nodes on the path."""
+        node = self.root
+        path = [node]
+        while not state.game_end()[0]:
+            if self.first_child[node] < 0:
+                self._allocate_children(node, state)
+            if self.rave_equivalence > 0:
+                expanded = self.n_expanded[node]
+                node = self.select_rave(node)
+                state.perform_action(int(self.action[node]))
+                path.append(node)
+                if self.n_expanded[path[-2]] > expanded:
+                    # the leaf keeps AMAF statistics from its first playout on
+                    if not state.game_end()[0]:
+                        self._allocate_children(node, state)
+                    break
+                continue
+            if self.n_expanded[node] < self.n_children[node]:
+                # children are in random order, so expanding the next one is a random choice
+                parent, node = node, self.first_child[node] + self.n_expanded[node]
+                self.n_expanded[parent] += 1
+                state.perform_action(int(self.action[node]))
+                path.append(node)
+                break
+            else:
+                node = self.select(node)
+                state.perform_action(int(self.action[node]))
+                path.append(node)
+        self.stats.add_path(len(path) - 1)
+        return np.array(path)
+
+    def backup(self, path, leaf_value):
+        # the leaf gets leaf_value, its parent -leaf_value and so on
+        signs = np.where(np.arange(len(path))[::-1] % 2 == 0, 1., -1.)
+        self.n_visits[path] += 1
+        self.U[path] += leaf_value * signs
+
+    def backup_amaf(self, path, player, state: State, leaf_value):
+        cells = state.to_array().reshape(-1)
+        p1, p2 = state._players
+        # the leaf is played by player, its parent by the opponent and so on
+        for i, node in enumerate(path[::-1]):
+            first = self.first_child[node]
+            if first < 0:
+                continue
+            last = first + self.n_children[node]
+            current, value = (player, leaf_value) if i % 2 == 0 else (p2 if player == p1 else p1, -leaf_value)
+            played = cells[self.action[first:last]] == current
+            self.amaf_visits[first:last] += played
+            self.amaf_U[first:last] += played * value
+
+    def add_virtual_visits(self, path, n_visits, U):
+        self.n_visits[path] += n_visits
+        self.U[path] += U
+
+    def _expanded_children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.n_expanded[node]) if first >= 0 else range(0)
+
+    def get_tree_size(self):
+        size, nodes = 0, [self.root]
+        while nodes:
+            node = nodes.pop()
+            size += 1
+            nodes.extend(self._expanded_children(node))
+        return size
+
+    def get_root_visits(self):
+        return {int(self.action[i]): int(self.n_visits[i]) for i in self._expanded_children(self.root)}
+
+    def get_root_stats(self):
+        return {int(self.action[i]): (int(self.n_visits[i]), float(self.U[i]))
+                for i in self._expanded_children(self.root)}
+
+    def update_with_move(self, action):
+        for i in self._expanded_children(self.root):
+            if self.action[i] == action:
+                self.root = i
+                return True
+        return False
+
+
+def parallel_search(player, state: State, n_playout, seed):
+    """
+    Grow a new tree of player from state in a worker process of root-parallel search.
+
+    Return: the root statistics of the tree, see MCTS.get_root_stats, and the SearchStats
+        of the search.
+    """
+    random.seed(seed)
+    np.random.seed(seed % (1 << 32))
+    mcts = player.new_search(state)
+    state.set_stats(mcts.stats)
+    mcts.run(state, n_playout, player.time_ms)
+    mcts.stats.tree_size = mcts.get_tree_size()
+    return mcts.get_root_stats(), mcts.stats
+
+
 class MCTSPlayer(Player):
     """AI player based on MCTS"""
-    def __init__(self, c=5, n_playout=2000):
+    def __init__(self, c=5, n_playout=2000, use_candidates=False, reuse_tree=True, array_tree=False,
+                 n_workers=1, n_rollout=0, time_ms=None, threat_search=False, use_symmetry=False,
+                 rave_equivalence=0):
+        """
+        Parameters:
+            reuse_tree: keep the tree between moves, so that the subtree of our move and
+                the opponent's reply becomes the root of the next search. The playouts
+                already under it count toward n_playout, so the next search only runs
+                the ones it lacks.
+            array_tree: store the tree as arrays (ArrayMCTS) instead of TreeNode objects.
+            n_workers: the number of processes for root-parallel search. Each one grows
+                its own tree with n_playout / n_workers playouts and the visit counts at
+                the roots are summed. Trees are not reused in this mode.
+            n_rollout: the number of random games played at once per leaf, 0 to play
+                a single one move by move.
+            time_ms: if not None, search each move in anytime mode (see MCTS.run) with
+                time_ms milliseconds, and n_playout (which may be None) only as a limit.
+            threat_search: play at once the move found by a threat-space search
+                (ThreatSearch.find_forced_move) if there is one.
+            use_symmetry: share one child between the actions leading to positions equal
+                up to a symmetry of the board (mostly in the opening).
+            rave_equivalence: if positive, select children with RAVE, see MCTS.
+        """
         super().__init__()
         self.c_puct = c
         self.n_playout = n_playout
+        self.use_candidates = use_candidates
+        self.reuse_tree = reuse_tree
+        self.array_tree = array_tree
+        self.n_workers = n_workers
+        self.n_rollout = n_rollout
+        self.time_ms = time_ms
+        self.threat_search = ThreatSearch() if threat_search else None
+        self.use_symmetry = use_symmetry
+        self.rave_equivalence = rave_equivalence
+        self.completed_playouts = 0  # the number of playouts run for the last action
+        self.root_visits = {}  # action -> visit count of the root children for the last action
+        self.mcts = None
+        self.last_state = None  # the state after our last action
+        self.pool = None
+
+    def __getstate__(self):
+        # workers only need the settings to build their own trees
+        d = self.__dict__.copy()
+        d["mcts"], d["last_state"], d["pool"] = None, None, None
+        return d
+
+    def set_player(self, p):
+        super().set_player(p)
+        # a new game starts
+        self.mcts, self.last_state = None, None
+
+    def new_search(self, state: State):
+        mcts_class = ArrayMCTS if self.array_tree else MCTS
+        return mcts_class(state, self.c_puct, self.n_playout, self.use_candidates, self.n_rollout,
+                          self.use_symmetry, self.rave_equivalence)
+
+    def get_search(self, state: State):
+        """
+        Return the tree kept from the last move, advanced by the opponent's reply,
+        or a new tree if there is none or it does not lead to state.
+        """
+        mcts, self.mcts = self.mcts, None
+        move = state.get_last_move()
+        if mcts is not None and move in self.last_state.get_all_actions():
+            last_state = self.last_state.perform_action(move)
+            if last_state.get_hash() == state.get_hash() and mcts.update_with_move(move):
+                return mcts
+        return self.new_search(state)
+
+    def get_parallel_action(self, state: State):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.n_workers)
+        n_playout = None if self.n_playout is None else -(-self.n_playout // self.n_workers)
+        self.stats.reset()
+        futures = [self.pool.submit(parallel_search, self, state, n_playout, random.getrandbits(64))
+                   for _ in range(self.n_workers)]
+        root_stats = {}
+        for future in futures:
+            worker_root_stats, worker_search_stats = future.result()
+            # the counters and times of the workers are summed
+            self.stats.merge(worker_search_stats)
+            for action, (n_visits, U) in worker_root_stats.items():
+                total_visits, total_U = root_stats.get(action, (0, 0.))
+                root_stats[action] = (total_visits + n_visits, total_U + U)
+        self.completed_playouts = self.stats.playouts
+        self.stats.stop()
+        self.root_visits = {action: n_visits for action, (n_visits, U) in root_stats.items()}
+        return max(root_stats.items(), key=lambda act_stats: act_stats[1][0])[0]
 
     def get_action(self, state: State):
-        mcts = MCTS(state, self.c_puct, self.n_playout)
-        for n in range(self.n_playout):
-            state_copy = copy.deepcopy(state)
-            mcts.playout(state_copy)
-        return max(mcts.root.children.items(),
-                   key=lambda act_node: act_node[1].n_visits)[0]
+        if self.threat_search is not None:
+            self.stats.reset()
+            move = self.threat_search.find_forced_move(state)
+            if move is not None:
+                self.stats.nodes = self.threat_search.nodes
+                self.stats.stop()
+                # the kept tree does not follow this move
+                self.mcts, self.last_state = None, None
+                self.root_visits = {move: 1}
+                return move
+        if self.n_workers > 1:
+            return self.get_parallel_action(state)
+        state = self.new_stats(state)
+        mcts = self.get_search(state) if self.reuse_tree else self.new_search(state)
+        mcts.stats = self.stats
+        n_playout = self.n_playout
+        if n_playout is not None:
+            # the playouts of the kept tree (and of ponder) below the new root count for this action
+            n_playout = max(n_playout - sum(mcts.get_root_visits().values()), 1)
+        self.completed_playouts = mcts.run(state, n_playout, self.time_ms)
+        self.root_visits = mcts.get_root_visits()
+        action = max(self.root_visits.items(),
+                     key=lambda act_visits: act_visits[1])[0]
+        self.stats.tree_size = mcts.get_tree_size()
+        self.stats.stop()
+        if self.reuse_tree and mcts.update_with_move(action):
+            self.mcts = mcts
+            self.last_state = copy.deepcopy(state).perform_action(action)
+        return action
+
+    def ponder(self, state: State, stop_event):
+        """
+        Grow the kept tree from state (the state after our action) until stop_event is set,
+        or for at most n_playout playouts. The subtree of the opponent's reply is then
+        the root of the next search, which runs only the playouts it still lacks.
+        """
+        if self.mcts is None or self.last_state.get_hash() != state.get_hash():
+            return
+        mcts = self.mcts
+        mcts.stats = SearchStats()
+        state.set_stats(mcts.stats)
+        state.update_info()
+        n_done = 0
+        while not stop_event.is_set() and not state.game_end()[0]:
+            if self.n_playout is not None and n_done >= self.n_playout:
+                break
+            n_done += mcts.run_batch(state, float("inf") if self.n_playout is None else self.n_playout - n_done)
+
+    def close(self):
+        """Shut down the worker processes of root-parallel search."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
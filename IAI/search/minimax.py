@@ -1,8 +1,12 @@
+import time
 from typing import Tuple
 from copy import deepcopy
-from game import State, Player
+from game import State, Player, SearchStats
+from transposition import TranspositionTable
+from threat import ThreatSearch
 
 inf = 10000
+NULL_WINDOW = 1e-6  # width of the windows only telling whether a value is above a bound
 
 
 class MinimaxSearchPlayer(Player):
@@ -10,11 +14,21 @@ class MinimaxSearchPlayer(Player):
     Player based on minimax search.
     """
 
+    def __init__(self, use_candidates=False):
+        """
+        Parameters:
+            use_candidates: only search the actions near existing stones
+                (state.get_candidate_actions()) instead of all actions.
+        """
+        super().__init__()
+        self.use_candidates = use_candidates
+
     def get_action(self, state: State):
         """
         An interface for recursively searching.
         """
         assert state.get_current_player() == self.player
+        stats = self.stats
 
         def minimax_search(s: State) -> Tuple:
             """
@@ -27,36 +41,44 @@ class MinimaxSearchPlayer(Player):
             Return:
                 Tuple(value, action): the node value and the best action (if exists)
             
-            Note: before you perform an action, you might need to copy the original state for in-place update.
+            Note: the search is done in place, every performed action is taken back with undo_action.
             """
+            stats.nodes += 1
             end, winner = s.game_end()
             value, action = None, None
             if end:
+                stats.leaf_evals += 1
                 if winner == -1:
                     value = 0
                 else:
                     value = (1 if winner == self.player else -1)
             else:
                 # TODO
-                actions = s.get_all_actions()
+                actions = list(s.get_candidate_actions() if self.use_candidates else s.get_all_actions())
                 # print("action:", actions)
                 if s.get_current_player() == self.player:
                     for a in actions:
-                        # note: deepcopy is used to copy the state, because perform_action is in-place update
-                        tmpvalue, tmpaction = minimax_search(deepcopy(s).perform_action(a))
+                        s.perform_action(a)
+                        tmpvalue, tmpaction = minimax_search(s)
+                        s.undo_action()
                         if value == None or tmpvalue > value:
                             value = tmpvalue
                             action = a
                 else:
                     for a in actions:
-                        tmpvalue, tmpaction = minimax_search(deepcopy(s).perform_action(a))
+                        s.perform_action(a)
+                        tmpvalue, tmpaction = minimax_search(s)
+                        s.undo_action()
                         if value == None or tmpvalue < value:
                             value = tmpvalue
                             action = a
                 
             return value, action
 
-        return minimax_search(state)[1]
+        # search on a single copy so the caller's state is never touched
+        action = minimax_search(self.new_stats(state))[1]
+        stats.stop()
+        return action
 
 
 class AlphaBetaSearchPlayer(Player):
@@ -64,11 +86,35 @@ class AlphaBetaSearchPlayer(Player):
     Player based on alpha-beta search.
     """
 
+    def __init__(self, tt_size=1 << 18, use_candidates=False, use_symmetry=False):
+        """
+        Parameters:
+            tt_size: number of slots of the transposition table, 0 to search without one.
+            use_candidates: only search the actions near existing stones
+                (state.get_candidate_actions()) instead of all actions.
+            use_symmetry: key the transposition table by state.get_canonical_hash(), so that
+                positions equal up to a symmetry of the board share their entries.
+        """
+        super().__init__()
+        self.tt = TranspositionTable(tt_size) if tt_size else None
+        self.use_candidates = use_candidates
+        self.use_symmetry = use_symmetry
+
+    def set_player(self, p):
+        super().set_player(p)
+        # stored values are relative to self.player
+        if self.tt is not None:
+            self.tt.clear()
+
     def get_action(self, state: State):
         """
         An interface for recursively searching.
         """
         assert state.get_current_player() == self.player
+        tt = self.tt
+        if tt is not None:
+            tt.new_search()
+        stats = self.stats
 
         def alpha_beta_search(s: State, alpha, beta):
             """
@@ -83,77 +129,238 @@ class AlphaBetaSearchPlayer(Player):
             Return:
                 Tuple(value, action): the node value and the best action (if exists)
             
-            Note: before you perform an action, you might need to copy the original state for in-place update.
+            Note: the search is done in place, every performed action is taken back with undo_action.
             """
+            stats.nodes += 1
             end, winner = s.game_end()
             value, action = None, None
             if end:
+                stats.leaf_evals += 1
                 if winner == -1:
                     value = 0
                 else:
                     value = (1 if winner == self.player else -1)
             else:
                 # TODO
-                actions = s.get_all_actions()
+                actions = list(s.get_candidate_actions() if self.use_candidates else s.get_all_actions())
+                alpha_orig, beta_orig = alpha, beta
+                if tt is not None:
+                    # the search always goes to the end of the game, so the number of
+                    # empty cells is the depth of the subtree
+                    key, symmetry = s.get_canonical_hash() if self.use_symmetry else (s.get_hash(), 0)
+                    depth = len(s.get_all_actions())
+                    tt_value, tt_move, alpha, beta = tt.lookup(key, depth, alpha, beta)
+                    if tt_move is not None:
+                        # moves are stored in the canonical orientation
+                        tt_move = s.from_canonical(tt_move, symmetry)
+                    if tt_value is not None:
+                        stats.tt_hits += 1
+                        return tt_value, tt_move
+                    if tt_move is not None:
+                        actions.remove(tt_move)
+                        actions.insert(0, tt_move)
                 # print("action:", actions)
                 if s.get_current_player() == self.player:
                     for a in actions:
-                        # note: deepcopy is used to copy the state, because perform_action is in-place update
-                        tmpvalue, tmpaction = alpha_beta_search(deepcopy(s).perform_action(a), alpha, beta)
+                        s.perform_action(a)
+                        tmpvalue, tmpaction = alpha_beta_search(s, alpha, beta)
+                        s.undo_action()
                         if value == None or tmpvalue > value:
                             value = tmpvalue
                             action = a
                         if value >= beta:
-                            return value, action
+                            stats.cutoffs += 1
+                            break
                         alpha = max(alpha, value)
                 else:
                     for a in actions:
-                        tmpvalue, tmpaction = alpha_beta_search(deepcopy(s).perform_action(a), alpha, beta)
+                        s.perform_action(a)
+                        tmpvalue, tmpaction = alpha_beta_search(s, alpha, beta)
+                        s.undo_action()
                         if value == None or tmpvalue < value:
                             value = tmpvalue
                             action = a
                         if value <= alpha:
-                            return value, action
+                            stats.cutoffs += 1
+                            break
                         beta = min(beta, value)
-                
+                if tt is not None:
+                    tt.store(key, depth, value, alpha_orig, beta_orig, s.to_canonical(action, symmetry))
 
             return value, action
 
-        return alpha_beta_search(state, -inf, inf)[1]
+        action = alpha_beta_search(self.new_stats(state), -inf, inf)[1]
+        stats.stop()
+        return action
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its time budget runs out."""
 
 
 class CuttingOffAlphaBetaSearchPlayer(Player):
 
-    def __init__(self, max_depth, evaluation_func=None):
+    def __init__(self, max_depth, evaluation_func=None, tt_size=1 << 18, time_ms=None, use_candidates=False,
+                 threat_search=False, use_symmetry=False):
         """
         Player based on cutting off alpha-beta search.
         Parameters:
             max_depth: maximum searching depth. The search will stop when the depth exists max_depth.
             evaluation_func: a function taking a state as input and
                 outputs the value in the current player's perspective.
+            tt_size: number of slots of the transposition table, 0 to search without one.
+            time_ms: time budget per move in milliseconds. If given, the search deepens
+                iteratively (ignoring max_depth) until the budget runs out, and the best
+                action of the last finished iteration is played.
+            use_candidates: only search the actions near existing stones
+                (state.get_candidate_actions()) instead of all actions.
+            threat_search: play at once the move found by a threat-space search
+                (ThreatSearch.find_forced_move) if there is one.
+            use_symmetry: key the transposition table by state.get_canonical_hash(), so that
+                positions equal up to a symmetry of the board share their entries.
         """
         super().__init__()
         self.max_depth = max_depth
         self.evaluation_func = (lambda s: 0) if evaluation_func is None else evaluation_func
+        self.tt = TranspositionTable(tt_size) if tt_size else None
+        self.time_ms = time_ms
+        self.use_candidates = use_candidates
+        self.threat_search = ThreatSearch() if threat_search else None
+        self.use_symmetry = use_symmetry
+        self.completed_depth = 0  # depth of the last finished iteration
+        self.killers = {}  # ply -> the two latest actions that caused a cutoff
+        self.history = {}  # (player, action) -> cutoff score
+        self.ponder_result = None  # (hash, action) of the position searched by ponder
+        self.ponder_hits = 0
+
+    def set_player(self, p):
+        super().set_player(p)
+        # stored values are relative to self.player
+        if self.tt is not None:
+            self.tt.clear()
+        self.ponder_result = None
 
     def evaluation(self, state: State):
         """
         Calculate the evaluation value relative to the agent player (rather than state's current player),
         i.e., take negation if the current player is opponent or do nothing else wise.
         """
+        start = time.perf_counter()
         value = self.evaluation_func(state)
+        self.stats.evaluator_time += time.perf_counter() - start
+        self.stats.leaf_evals += 1
         if self.player != state.get_current_player():
             value = -value
         # print("value",value)
         return value
 
+    def order_actions(self, s: State, actions, ply, first=None):
+        """
+        Sort actions for searching: the given first action (the previous iteration's best
+        or the transposition table move), then the killer actions of this ply, then the
+        rest by history score.
+        """
+        player = s.get_current_player()
+        history = self.history
+        ordered = sorted(actions, key=lambda a: -history.get((player, a), 0))
+        front = [first] + self.killers.get(ply, [])
+        for a in reversed(front):
+            if a is not None and a in ordered:
+                ordered.remove(a)
+                ordered.insert(0, a)
+        return ordered
+
+    def record_cutoff(self, s: State, action, ply, d):
+        killers = self.killers.setdefault(ply, [])
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[2:]
+        key = (s.get_current_player(), action)
+        self.history[key] = self.history.get(key, 0) + d * d
+
+    def get_forced_move(self, state: State):
+        """Return the move found by the threat-space search (if used and found), or None."""
+        if self.threat_search is None:
+            return None
+        self.stats.reset()
+        move = self.threat_search.find_forced_move(state)
+        if move is not None:
+            self.stats.nodes = self.threat_search.nodes
+            self.stats.stop()
+        return move
+
     def get_action(self, state: State):
         """
         An interface for recursively searching.
         """
         assert state.get_current_player() == self.player
+        move = self.get_forced_move(state)
+        if move is None:
+            move = self.get_ponder_move(state)
+        if move is not None:
+            return move
+        return self.search(state, self.max_depth, self.time_ms)
+
+    def get_ponder_move(self, state: State):
+        """Return the action found by ponder if it searched state, or None."""
+        result, self.ponder_result = self.ponder_result, None
+        if result is None or result[0] != state.get_hash():
+            return None
+        self.ponder_hits += 1
+        self.stats.reset()
+        self.stats.stop()
+        return result[1]
+
+    def ponder(self, state: State, stop_event):
+        """
+        Search the position after the reply expected from the opponent in state (the
+        transposition table move) until stop_event is set. A finished fixed depth search
+        is played at once if the opponent does reply so, the transposition table entries
+        of an unfinished search or of iterative deepening speed up the next search.
+        """
+        if self.tt is None:
+            return
+        key, symmetry = state.get_canonical_hash() if self.use_symmetry else (state.get_hash(), 0)
+        reply = self.tt.get_move(key)
+        if reply is None or state.game_end()[0]:
+            return
+        state = deepcopy(state)
+        state.perform_action(state.from_canonical(reply, symmetry))
+        if state.game_end()[0]:
+            return
+        # the stats of the last action are kept
+        stats, self.stats = self.stats, SearchStats()
+        try:
+            if self.time_ms is None:
+                action = self.search(state, self.max_depth, None, stop_event)
+                self.ponder_result = (state.get_hash(), action)
+            else:
+                # deepen until stopped
+                self.search(state, self.max_depth, float("inf"), stop_event)
+        except SearchTimeout:
+            pass
+        finally:
+            self.stats = stats
+
+    def search(self, state: State, max_depth, time_ms, stop_event=None):
+        """
+        Return the best action in state found with max_depth, or by iterative deepening
+        in time_ms milliseconds if time_ms is not None.
+
+        Parameters:
+            stop_event: a threading.Event stopping the search (with SearchTimeout)
+                when set, if not None.
+        """
+        assert state.get_current_player() == self.player
+        tt = self.tt
+        if tt is not None:
+            tt.new_search()
+        self.killers, self.history = {}, {}
+        deadline = None
+        stats = self.stats
+        root = self.new_stats(state)
 
-        def cutting_off_alpha_beta_search(s: State, d, alpha, beta):
+        def cutting_off_alpha_beta_search(s: State, d, alpha, beta, ply=0, first=None):
             """
             Search for several depth and use evaluation value as cutting off.
 
@@ -162,16 +369,24 @@ class CuttingOffAlphaBetaSearchPlayer(Player):
                 d: the remaining search depth, the search will stop when d=0
                 alpha: the current maximum value of the max player
                 beta: the current minimum value of the min player
+                ply: the number of actions performed since the root
+                first: the action to search first (if exists)
 
             Return:
                 Tuple(value, action): the node value and the best action (if exists)
             
-            Note: before you perform an action, you might need to copy the original state for in-place update.
+            Note: the search is done in place, every performed action is taken back with undo_action.
             """
+            if deadline is not None and time.time() > deadline:
+                raise SearchTimeout
+            if stop_event is not None and stop_event.is_set():
+                raise SearchTimeout
+            stats.nodes += 1
             # one depth = two plies
             end, winner = s.game_end()
             value, action = None, None
             if end:
+                stats.leaf_evals += 1
                 if winner == -1:
                     value = 0
                 else:
@@ -181,27 +396,207 @@ class CuttingOffAlphaBetaSearchPlayer(Player):
                 if d == 0:
                     value = self.evaluation(s)
                     return value, action
-                actions = s.get_all_actions()
+                alpha_orig, beta_orig = alpha, beta
+                if tt is not None:
+                    key, symmetry = s.get_canonical_hash() if self.use_symmetry else (s.get_hash(), 0)
+                    tt_value, tt_move, alpha, beta = tt.lookup(key, d, alpha, beta)
+                    if tt_move is not None:
+                        # moves are stored in the canonical orientation
+                        tt_move = s.from_canonical(tt_move, symmetry)
+                    if tt_value is not None and ply > 0:
+                        stats.tt_hits += 1
+                        return tt_value, tt_move
+                    if first is None:
+                        first = tt_move
+                actions = s.get_candidate_actions() if self.use_candidates else s.get_all_actions()
+                actions = self.order_actions(s, actions, ply, first)
                 # print("action:", actions)
                 if s.get_current_player() == self.player:
                     for a in actions:
-                        # note: deepcopy is used to copy the state, because perform_action is in-place update
-                        tmpvalue, tmpaction = cutting_off_alpha_beta_search(deepcopy(s).perform_action(a), d, alpha, beta)
+                        s.perform_action(a)
+                        tmpvalue, tmpaction = cutting_off_alpha_beta_search(s, d, alpha, beta, ply + 1)
+                        s.undo_action()
                         if value == None or tmpvalue > value:
                             value = tmpvalue
                             action = a
                         if value >= beta:
-                            return value, action
+                            stats.cutoffs += 1
+                            self.record_cutoff(s, a, ply, d)
+                            break
                         alpha = max(alpha, value)
                 else:
                     for a in actions:
-                        tmpvalue, tmpaction = cutting_off_alpha_beta_search(deepcopy(s).perform_action(a), d-1, alpha, beta)
+                        s.perform_action(a)
+                        tmpvalue, tmpaction = cutting_off_alpha_beta_search(s, d-1, alpha, beta, ply + 1)
+                        s.undo_action()
                         if value == None or tmpvalue < value:
                             value = tmpvalue
                             action = a
                         if value <= alpha:
-                            return value, action
+                            stats.cutoffs += 1
+                            self.record_cutoff(s, a, ply, d)
+                            break
                         beta = min(beta, value)
+                if tt is not None:
+                    tt.store(key, d, value, alpha_orig, beta_orig, s.to_canonical(action, symmetry))
             return value, action
 
-        return cutting_off_alpha_beta_search(state, self.max_depth, -inf, inf)[1]
+        if time_ms is None:
+            self.completed_depth = max_depth
+            action = cutting_off_alpha_beta_search(root, max_depth, -inf, inf)[1]
+            stats.stop()
+            return action
+
+        # iterative deepening, the first iteration always finishes so that there is an action
+        start = time.time()
+        best_action, depth = None, 1
+        while True:
+            try:
+                value, action = cutting_off_alpha_beta_search(deepcopy(root), depth, -inf, inf, first=best_action)
+            except SearchTimeout:
+                break
+            best_action, self.completed_depth = action, depth
+            # stop once the result is decided or the whole game tree has been searched
+            if abs(value) >= 1 or 2 * depth >= len(state.get_all_actions()):
+                break
+            depth += 1
+            deadline = start + time_ms / 1000
+        stats.stop()
+        return best_action
+
+
+class PrincipalVariationSearchPlayer(CuttingOffAlphaBetaSearchPlayer):
+    """
+    Player based on principal variation search (NegaScout), in negamax form.
+
+    Only the first (best ordered) action of a node is searched with the full window,
+    the others with a null window proving that they are not better, and searched again
+    with the full window if they are. The search deepens iteratively, each iteration
+    starting with an aspiration window around the value of the previous one.
+    """
+
+    def __init__(self, max_depth, evaluation_func=None, tt_size=1 << 18, time_ms=None, use_candidates=False,
+                 threat_search=False, use_symmetry=False, aspiration_window=0.1):
+        """
+        Parameters:
+            see CuttingOffAlphaBetaSearchPlayer.
+            aspiration_window: half width of the window around the value of the previous
+                iteration, 0 to always search with the full window.
+        """
+        super().__init__(max_depth, evaluation_func, tt_size, time_ms, use_candidates, threat_search,
+                         use_symmetry)
+        self.aspiration_window = aspiration_window
+        self.n_researches = 0  # null window and aspiration searches searched again
+
+    def search(self, state: State, max_depth, time_ms, stop_event=None):
+        assert state.get_current_player() == self.player
+        tt = self.tt
+        if tt is not None:
+            tt.new_search()
+        self.killers, self.history = {}, {}
+        self.n_researches = 0
+        deadline = None
+        stats = self.stats
+        root = self.new_stats(state)
+
+        def principal_variation_search(s: State, d, alpha, beta, ply=0, first=None):
+            """
+            Parameters:
+                s: the current state
+                d: the remaining search depth in plies, the search will stop when d=0
+                alpha, beta: the search window, in the current player's perspective
+                ply: the number of actions performed since the root
+                first: the action to search first (if exists)
+
+            Return:
+                Tuple(value, action): the node value in the current player's perspective
+                and the best action (if exists)
+
+            Note: the search is done in place, every performed action is taken back with undo_action.
+            """
+            if deadline is not None and time.time() > deadline:
+                raise SearchTimeout
+            if stop_event is not None and stop_event.is_set():
+                raise SearchTimeout
+            stats.nodes += 1
+            end, winner = s.game_end()
+            if end:
+                stats.leaf_evals += 1
+                if winner == -1:
+                    return 0, None
+                return (1 if winner == s.get_current_player() else -1), None
+            if d == 0:
+                # self.evaluation is relative to the agent player
+                value = self.evaluation(s)
+                return (value if s.get_current_player() == self.player else -value), None
+            alpha_orig, beta_orig = alpha, beta
+            if tt is not None:
+                key, symmetry = s.get_canonical_hash() if self.use_symmetry else (s.get_hash(), 0)
+                tt_value, tt_move, alpha, beta = tt.lookup(key, d, alpha, beta)
+                if tt_move is not None:
+                    # moves are stored in the canonical orientation
+                    tt_move = s.from_canonical(tt_move, symmetry)
+                if tt_value is not None and ply > 0:
+                    stats.tt_hits += 1
+                    return tt_value, tt_move
+                if first is None:
+                    first = tt_move
+            actions = s.get_candidate_actions() if self.use_candidates else s.get_all_actions()
+            actions = self.order_actions(s, actions, ply, first)
+            value, action = -inf, None
+            for i, a in enumerate(actions):
+                s.perform_action(a)
+                if i == 0:
+                    tmpvalue = -principal_variation_search(s, d - 1, -beta, -alpha, ply + 1)[0]
+                else:
+                    tmpvalue = -principal_variation_search(s, d - 1, -alpha - NULL_WINDOW, -alpha, ply + 1)[0]
+                    if alpha < tmpvalue < beta:
+                        self.n_researches += 1
+                        tmpvalue = -principal_variation_search(s, d - 1, -beta, -alpha, ply + 1)[0]
+                s.undo_action()
+                if tmpvalue > value:
+                    value = tmpvalue
+                    action = a
+                if value >= beta:
+                    stats.cutoffs += 1
+                    self.record_cutoff(s, a, ply, d)
+                    break
+                alpha = max(alpha, value)
+            if tt is not None:
+                tt.store(key, d, value, alpha_orig, beta_orig, s.to_canonical(action, symmetry))
+            return value, action
+
+        # iterative deepening, the first iteration always finishes so that there is an action
+        start = time.time()
+        best_action, best_value, depth = None, None, 1
+        while True:
+            if best_value is None or not self.aspiration_window:
+                alpha, beta = -inf, inf
+            else:
+                alpha, beta = best_value - self.aspiration_window, best_value + self.aspiration_window
+            try:
+                while True:
+                    # one depth = two plies
+                    value, action = principal_variation_search(deepcopy(root), 2 * depth, alpha, beta,
+                                                               first=best_action)
+                    # outside of the window the value is only a bound, search again with the window open on that side
+                    if value <= alpha and alpha > -inf:
+                        alpha = -inf
+                    elif value >= beta and beta < inf:
+                        beta = inf
+                    else:
+                        break
+                    self.n_researches += 1
+            except SearchTimeout:
+                break
+            best_action, best_value, self.completed_depth = action, value, depth
+            # stop once the result is decided or the whole game tree has been searched
+            if abs(value) >= 1 or 2 * depth >= len(state.get_all_actions()):
+                break
+            if time_ms is None and depth >= max_depth:
+                break
+            depth += 1
+            if time_ms is not None:
+                deadline = start + time_ms / 1000
+        stats.stop()
+        return best_action
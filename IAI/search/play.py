@@ -1,58 +1,127 @@
 from __future__ import print_function
 
-from game import Board, DummyPlayer, Human, Game
-from minimax import MinimaxSearchPlayer, AlphaBetaSearchPlayer, CuttingOffAlphaBetaSearchPlayer
+from game import Board, ArrayBoard, DummyPlayer, Human, Game
+from minimax import MinimaxSearchPlayer, AlphaBetaSearchPlayer, CuttingOffAlphaBetaSearchPlayer, \
+    PrincipalVariationSearchPlayer
 from mcts import MCTSPlayer
 from alphazero import AlphaZeroPlayer
-from evaluation import get_evaluation_func
+from evaluation import CachedEvaluation, get_evaluation_func, get_batch_evaluation_func
 
 
-def get_player(player_name, args):
+def get_board(board_name, args):
+    kwargs = dict(width=args.width, height=args.height, n_in_row=args.n_in_row,
+                  candidate_distance=args.candidate_distance, symmetry=args.use_symmetry)
+    if board_name == "Board":
+        return Board(**kwargs)
+    elif board_name == "ArrayBoard":
+        return ArrayBoard(**kwargs)
+    else:
+        raise KeyError(board_name)
+
+
+def get_n_playout(args):
+    # with a time budget the number of playouts is only limited if given
+    if args.n_playout is None and args.time_ms is None:
+        return 5000
+    return args.n_playout
+
+
+def get_batch_evaluation(evaluation_func, args):
+    if isinstance(evaluation_func, CachedEvaluation):
+        return evaluation_func.evaluate_batch
+    return get_batch_evaluation_func(args.evaluation_func, args.value_net_weights)
+
+
+def get_player(player_name, args, evaluation_func=None):
+    """
+    Parameters:
+        evaluation_func: the evaluation function of the searching players, built from
+            args if None. Passing the same one to both players shares its cache.
+    """
+    if evaluation_func is None:
+        evaluation_func = get_evaluation_func(args.evaluation_func, args.eval_cache_size, args.use_symmetry,
+                                              args.value_net_weights)
     if player_name == "DummyPlayer":
         return DummyPlayer()
     elif player_name == "Human":
         return Human()
     elif player_name == "MinimaxSearchPlayer":
-        return MinimaxSearchPlayer()
+        return MinimaxSearchPlayer(args.use_candidates)
     elif player_name == "AlphaBetaSearchPlayer":
-        return AlphaBetaSearchPlayer()
+        return AlphaBetaSearchPlayer(args.tt_size, args.use_candidates, args.use_symmetry)
     elif player_name == "CuttingOffAlphaBetaSearchPlayer":
-        return CuttingOffAlphaBetaSearchPlayer(args.max_depth, get_evaluation_func(args.evaluation_func))
+        return CuttingOffAlphaBetaSearchPlayer(args.max_depth, evaluation_func, args.tt_size,
+                                               args.time_ms, args.use_candidates, args.threat_search,
+                                               args.use_symmetry)
+    elif player_name == "PrincipalVariationSearchPlayer":
+        return PrincipalVariationSearchPlayer(args.max_depth, evaluation_func, args.tt_size, args.time_ms,
+                                              args.use_candidates, args.threat_search, args.use_symmetry,
+                                              args.aspiration_window)
     elif player_name == "MCTSPlayer":
-        return MCTSPlayer(args.c, args.n_playout)
+        return MCTSPlayer(args.c, get_n_playout(args), args.use_candidates, not args.no_reuse_tree, args.array_tree,
+                          args.n_workers, args.n_rollout, args.time_ms, args.threat_search, args.use_symmetry,
+                          args.rave_equivalence)
     elif player_name == "AlphaZeroPlayer":
-        return AlphaZeroPlayer(get_evaluation_func(args.evaluation_func), args.c, args.n_playout)
+        return AlphaZeroPlayer(evaluation_func, args.c, get_n_playout(args),
+                               args.use_candidates, not args.no_reuse_tree, args.array_tree, args.n_workers,
+                               args.batch_size, get_batch_evaluation(evaluation_func, args), args.time_ms,
+                               args.threat_search, args.use_symmetry)
     else:
         raise KeyError(player_name)
 
 
 def run(args):
-    n = args.n_in_row
-    width, height = args.width, args.height
     try:
-        board = Board(width=width, height=height, n_in_row=n)
+        board = get_board(args.board, args)
         game = Game(board)
-        player_1 = get_player(args.player_1, args)
-        player_2 = get_player(args.player_2, args)
+        evaluation_func = get_evaluation_func(args.evaluation_func, args.eval_cache_size, args.use_symmetry,
+                                              args.value_net_weights)
+        player_1 = get_player(args.player_1, args, evaluation_func)
+        player_2 = get_player(args.player_2, args, evaluation_func)
         # set start_player=0 for human first
-        game.start_play(player_1, player_2, start_player=0, is_shown=1)
+        game.start_play(player_1, player_2, start_player=0, is_shown=1, show_stats=args.show_stats,
+                        ponder=args.ponder)
+        if isinstance(evaluation_func, CachedEvaluation):
+            print("Evaluation cache:", evaluation_func)
     except KeyboardInterrupt:
         print('\n\rquit')
 
 
-if __name__ == '__main__':
+def get_parser():
     import argparse
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--width", type=int, default=9, help="Width of board.")
     parser.add_argument("--height", type=int, default=9, help="Height of board.")
     parser.add_argument("--n_in_row", type=int, default=5, help="Number of pieces in a row to win.")
+    parser.add_argument("--board", type=str, default="Board", help="Board representation (Board or ArrayBoard).")
+    parser.add_argument("--candidate_distance", type=int, default=2, help="Distance to the nearest stone of candidate actions (with --use_candidates).")
+    parser.add_argument("--use_candidates", action="store_true", help="Only search actions near existing stones.")
+    parser.add_argument("--show_stats", action="store_true", help="Print what the players did to choose every move.")
+    parser.add_argument("--ponder", action="store_true", help="Let the searching players keep searching while their opponent thinks (CuttingOffAlphaBetaSearch/PrincipalVariationSearch/MCTS/AlphaZero only).")
+    parser.add_argument("--threat_search", action="store_true", help="Play forced wins and blocks found by threat-space search at once (CuttingOffAlphaBetaSearch/PrincipalVariationSearch/MCTS/AlphaZero only).")
+    parser.add_argument("--use_symmetry", action="store_true", help="Share transposition table entries, evaluation cache entries and MCTS children between positions equal up to a symmetry of the board.")
     parser.add_argument("--player_1", type=str, default="DummyPlayer", help="Agent of Player 1")
     parser.add_argument("--player_2", type=str, default="DummyPlayer", help="Agent of Player 2")
-    parser.add_argument("--max_depth", type=int, default=1, help="Maximum search depth (CuttingOffAlphaBetaSearch only).")
-    parser.add_argument("--evaluation_func", type=str, default="dummy_evaluation_func", help="Evaluation function (CuttingOffAlphaBetaSearch/AlphaZero only).")
+    parser.add_argument("--max_depth", type=int, default=1, help="Maximum search depth (CuttingOffAlphaBetaSearch/PrincipalVariationSearch only).")
+    parser.add_argument("--time_ms", type=int, default=None, help="Time budget per move in milliseconds, searching with iterative deepening instead of --max_depth (CuttingOffAlphaBetaSearch/PrincipalVariationSearch) or in anytime mode (MCTS/AlphaZero).")
+    parser.add_argument("--aspiration_window", type=float, default=0.1, help="Half width of the window around the value of the previous iteration, 0 to disable (PrincipalVariationSearch only).")
+    parser.add_argument("--tt_size", type=int, default=1 << 18, help="Transposition table slots, 0 to disable (AlphaBetaSearch/CuttingOffAlphaBetaSearch/PrincipalVariationSearch only).")
+    parser.add_argument("--evaluation_func", type=str, default="dummy_evaluation_func", help="Evaluation function (CuttingOffAlphaBetaSearch/PrincipalVariationSearch/AlphaZero only).")
+    parser.add_argument("--value_net_weights", type=str, default=None, help="Weights of value_net_evaluation_func trained by value_net.py, value_net.npz next to value_net.py by default.")
+    parser.add_argument("--eval_cache_size", type=int, default=0, help="Positions kept in a cache of evaluation values shared by both players, 0 to disable (CuttingOffAlphaBetaSearch/PrincipalVariationSearch/AlphaZero only).")
     parser.add_argument("--c", type=float, default=0.2, help="Trade-off hyperparameter (MCTS/AlphaZero only).")
-    parser.add_argument("--n_playout", type=int, default=5000, help="Number of playouts (MCTS/AlphaZero only).")
-    args = parser.parse_args()
+    parser.add_argument("--n_playout", type=int, default=None, help="Number of playouts, 5000 by default, or the limit with --time_ms (MCTS/AlphaZero only).")
+    parser.add_argument("--rave_equivalence", type=float, default=0, help="Blend all-moves-as-first statistics into selection (RAVE), with this many visits giving both values the same weight, 0 to disable (MCTS only).")
+    parser.add_argument("--no_reuse_tree", action="store_true", help="Build a new tree every move (MCTS/AlphaZero only).")
+    parser.add_argument("--array_tree", action="store_true", help="Store the search tree as arrays (MCTS/AlphaZero only).")
+    parser.add_argument("--n_workers", type=int, default=1, help="Processes for root-parallel search (MCTS/AlphaZero only).")
+    parser.add_argument("--batch_size", type=int, default=1, help="Leaves evaluated together under virtual loss (AlphaZero only).")
+    parser.add_argument("--n_rollout", type=int, default=0, help="Random games per leaf played at once on arrays, 0 for one game move by move (MCTS only).")
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_parser().parse_args()
 
     run(args)
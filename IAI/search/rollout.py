@@ -0,0 +1,67 @@
+"""
+Random rollouts played on stacked NumPy boards
+"""
+import numpy as np
+
+_window_tables = {}
+
+
+def window_table(width, height, n):
+    """
+    The cells of every run of n cells in a row, column or diagonal of a width x height
+    board, as an int array of shape (n_windows, n), shared by every board of the same size.
+    """
+    key = (width, height, n)
+    if key not in _window_tables:
+        windows = []
+        for dh, dw in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for h in range(height):
+                for w in range(width):
+                    cells = [(h + k * dh, w + k * dw) for k in range(n)]
+                    if all(0 <= i < height and 0 <= j < width for i, j in cells):
+                        windows.append([i * width + j for i, j in cells])
+        _window_tables[key] = np.array(windows, dtype=np.intp).reshape(-1, n)
+    return _window_tables[key]
+
+
+def batch_rollout(board, current_player, players, n_in_row, n_rollout, rng=np.random):
+    """
+    Play n_rollout random games from one position at once.
+
+    A random game fills the empty cells in a random order, alternating players. The
+    winner is the first player to complete a run of n_in_row, which is the run whose
+    last cell is filled earliest, so all games are scored together from the fill order
+    without playing them move by move.
+
+    Parameters:
+        board: an int array of shape (height, width), 0 for an empty cell, with no
+            completed run.
+        current_player: the player to move.
+        players: the two players.
+        n_in_row: the length of a winning run.
+        n_rollout: the number of random games.
+        rng: the random number generator.
+
+    Return: an array of shape (n_rollout,), +1 where current_player wins, -1 where the
+        opponent wins and 0 for a tie.
+    """
+    height, width = board.shape
+    flat = board.reshape(-1)
+    empty = np.flatnonzero(flat == 0)
+    # the turn at which every empty cell is filled in every game
+    turns = np.argsort(np.argsort(rng.random_sample((n_rollout, len(empty))), axis=1), axis=1)
+    opponent = players[1] if current_player == players[0] else players[0]
+    owners = np.tile(flat, (n_rollout, 1))
+    owners[:, empty] = np.where(turns % 2 == 0, current_player, opponent)
+    # stones already on the board were placed before turn 0
+    filled_at = np.full((n_rollout, height * width), -1)
+    filled_at[:, empty] = turns
+
+    windows = window_table(width, height, n_in_row)
+    window_owners = owners[:, windows]
+    complete = np.all(window_owners == window_owners[:, :, :1], axis=2)
+    completed_at = np.where(complete, filled_at[:, windows].max(axis=2), np.iinfo(filled_at.dtype).max)
+    first = completed_at.argmin(axis=1)
+    has_winner = complete[np.arange(n_rollout), first]
+    winner = window_owners[np.arange(n_rollout), first, 0]
+    return np.where(has_winner, np.where(winner == current_player, 1, -1), 0)
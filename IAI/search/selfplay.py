@@ -0,0 +1,185 @@
+"""
+Self-play data generator: games played in parallel processes, every position stored with
+the root visit distribution of the search and the final result in append-only shards
+"""
+from __future__ import print_function
+
+import glob
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from play import get_board, get_player, get_parser
+from arena import get_player_args
+
+
+def record_dtype(n_cells):
+    """
+    The fixed-width record of a position on a board of n_cells cells:
+        board: the pieces indexed by move, 0 for empty cells.
+        player: the player to move.
+        move: the move played.
+        visits: the visit distribution of the root children of the search, indexed by move
+            (a one-hot of the move for players without a tree).
+        result: the final result in the perspective of player (1 win, 0 tie, -1 loss).
+        game: the index of the game (seed + game index).
+        ply: the number of moves played before the position.
+    """
+    return np.dtype([("board", np.int8, (n_cells,)), ("player", np.int8), ("move", np.int16),
+                     ("visits", np.float32, (n_cells,)), ("result", np.int8), ("game", np.int32),
+                     ("ply", np.int16)])
+
+
+def write_meta(path, args):
+    """Write the board of the records to path/meta.json, or check that it is the one already there."""
+    meta = {"width": args.width, "height": args.height, "n_in_row": args.n_in_row}
+    meta_file = os.path.join(path, "meta.json")
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            old_meta = json.load(f)
+        if old_meta != meta:
+            raise Exception("{} holds records of another board: {}".format(path, old_meta))
+        return
+    os.makedirs(path, exist_ok=True)
+    with open(meta_file, "w") as f:
+        json.dump(meta, f)
+
+
+def load_meta(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+def open_shards(path):
+    """Return every shard of the records in path as a read-only np.memmap of record_dtype."""
+    meta = load_meta(path)
+    dtype = record_dtype(meta["width"] * meta["height"])
+    shards = []
+    for shard in sorted(glob.glob(os.path.join(path, "shard-*.bin"))):
+        # a shard may be empty or end with a record being written
+        n_records = os.path.getsize(shard) // dtype.itemsize
+        if n_records > 0:
+            shards.append(np.memmap(shard, dtype=dtype, mode="r", shape=(n_records,)))
+    return shards
+
+
+def load_records(path):
+    """Return all the records in path as one array in memory."""
+    shards = open_shards(path)
+    if not shards:
+        meta = load_meta(path)
+        return np.zeros(0, dtype=record_dtype(meta["width"] * meta["height"]))
+    return np.concatenate(shards)
+
+
+def append_records(path, name, records, shard_size):
+    """
+    Append records to the shard path/shard-<name>-<k>.bin with the lowest k holding less
+    than shard_size records.
+    """
+    k = 0
+    while True:
+        shard = os.path.join(path, "shard-{}-{:04d}.bin".format(name, k))
+        if not os.path.exists(shard) or os.path.getsize(shard) < shard_size * records.dtype.itemsize:
+            break
+        k += 1
+    with open(shard, "ab") as f:
+        f.write(records.tobytes())
+
+
+def play_game(args, game_index):
+    """
+    Play game game_index, player 1 moving first in even games and player 2 in odd ones,
+    with the random generators seeded with args.seed + game_index.
+
+    Return: the records of its positions and the winner.
+    """
+    seed = args.seed + game_index
+    random.seed(seed)
+    np.random.seed(seed % (1 << 32))
+    board = get_board(args.board, args)
+    board.reset(game_index % 2)
+    player_1 = get_player(args.player_1, get_player_args(args, args.options_1))
+    player_2 = get_player(args.player_2, get_player_args(args, args.options_2))
+    p1, p2 = board._players
+    player_1.set_player(p1)
+    player_2.set_player(p2)
+    players = {p1: player_1, p2: player_2}
+    n_cells = args.width * args.height
+    positions = []
+    try:
+        while True:
+            current_player = board.get_current_player()
+            player = players[current_player]
+            move = player.get_action(board)
+            visits = np.zeros(n_cells, dtype=np.float32)
+            for action, n_visits in (getattr(player, "root_visits", None) or {move: 1}).items():
+                visits[action] = n_visits
+            visits /= visits.sum()
+            if len(positions) < args.n_sampled_moves:
+                # opening moves drawn from the visit distribution, so that games differ
+                p = visits.astype(np.float64)
+                move = int(np.random.choice(n_cells, p=p / p.sum()))
+            positions.append((board.to_array().reshape(-1), current_player, move, visits))
+            board.perform_action(move)
+            end, winner = board.game_end()
+            if end:
+                break
+    finally:
+        player_1.close()
+        player_2.close()
+    records = np.zeros(len(positions), dtype=record_dtype(n_cells))
+    for ply, (pieces, current_player, move, visits) in enumerate(positions):
+        record = records[ply]
+        record["board"] = pieces
+        record["player"] = current_player
+        record["move"] = move
+        record["visits"] = visits
+        record["result"] = 0 if winner == -1 else (1 if winner == current_player else -1)
+        record["game"] = seed
+        record["ply"] = ply
+    return records, winner
+
+
+def run_worker(args, worker):
+    """Play the games worker, worker + n_processes, ... and append their records to the worker's shards."""
+    n_records = 0
+    for game_index in range(worker, args.n_games, args.n_processes):
+        records, winner = play_game(args, game_index)
+        append_records(args.output, "{}-{}".format(args.seed, worker), records, args.shard_size)
+        n_records += len(records)
+        print("game {}: {} positions, winner {}".format(args.seed + game_index, len(records), winner), flush=True)
+    return n_records
+
+
+def run(args):
+    write_meta(args.output, args)
+    start = time.time()
+    if args.n_processes > 1:
+        with ProcessPoolExecutor(args.n_processes) as pool:
+            n_records = sum(pool.map(run_worker, [args] * args.n_processes, range(args.n_processes)))
+    else:
+        n_records = run_worker(args, 0)
+    seconds = time.time() - start
+    print("{} positions of {} games in {:.1f} s ({:.1f} positions/s), {} in {}".format(
+        n_records, args.n_games, seconds, n_records / seconds,
+        sum(len(shard) for shard in open_shards(args.output)), args.output))
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    parser.set_defaults(player_1="MCTSPlayer", player_2="MCTSPlayer")
+    parser.add_argument("--output", type=str, default="selfplay", help="Directory of the shards, appended to if it exists.")
+    parser.add_argument("--n_games", type=int, default=10, help="Number of games, the first move alternating between the players.")
+    parser.add_argument("--n_processes", type=int, default=1, help="Processes playing games in parallel, each one writing its own shards.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generators of the first game, increased by one every game. Use a new one for every run appending to the same directory.")
+    parser.add_argument("--n_sampled_moves", type=int, default=0, help="Number of opening moves drawn from the visit distribution instead of the most visited move.")
+    parser.add_argument("--shard_size", type=int, default=1 << 20, help="Records per shard before a new one is started.")
+    parser.add_argument("--options_1", type=str, default="", help='Options of play.py overridden for player 1, given with "=", e.g. --options_1="--n_playout 200 --c 0.5".')
+    parser.add_argument("--options_2", type=str, default="", help="Options of play.py overridden for player 2.")
+    args = parser.parse_args()
+
+    run(args)
@@ -0,0 +1,263 @@
+"""
+Threat-space search: forced wins found by playing only fours (VCF) or fours and threes (VCT)
+"""
+from game import State, zobrist_table
+from rollout import window_table
+
+_window_lists = {}
+
+
+def window_lists(width, height, n):
+    """
+    The windows of window_table as tuples, and for every cell the indices of the
+    windows through it, shared by every board of the same size.
+    """
+    key = (width, height, n)
+    if key not in _window_lists:
+        windows = [tuple(int(c) for c in w) for w in window_table(width, height, n)]
+        cell_windows = [[] for _ in range(width * height)]
+        for i, window in enumerate(windows):
+            for c in window:
+                cell_windows[c].append(i)
+        _window_lists[key] = (windows, cell_windows)
+    return _window_lists[key]
+
+
+class ThreatSpace(object):
+    """
+    A board for threat-space search, keeping for every player the windows (runs of
+    n_in_row cells) free of the opponent's stones, grouped by the number of own stones.
+
+    A four is a window one stone short of a win, its empty cell is a winning cell;
+    a three is a move after which the player can make two winning cells at once.
+    """
+
+    def __init__(self, state: State):
+        height, width = state._height, state._width
+        self.n = state._n_in_row
+        self.players = list(state._players)
+        self.cells = [int(p) for p in state.to_array().reshape(-1)]
+        self.windows, self.cell_windows = window_lists(width, height, self.n)
+        self.counts = {p: [0] * len(self.windows) for p in self.players}
+        # live[p][k]: the windows with k stones of p and none of the opponent
+        self.live = {p: [set() for _ in range(self.n + 1)] for p in self.players}
+        self.zobrist = zobrist_table(len(self.cells))
+        self.hash = 0
+        for i, window in enumerate(self.windows):
+            for p in self.players:
+                self.counts[p][i] = sum(self.cells[c] == p for c in window)
+        for i in range(len(self.windows)):
+            p, q = self.players
+            if self.counts[q][i] == 0:
+                self.live[p][self.counts[p][i]].add(i)
+            if self.counts[p][i] == 0:
+                self.live[q][self.counts[q][i]].add(i)
+        for c, p in enumerate(self.cells):
+            if p:
+                self.hash ^= self.zobrist[p][c]
+
+    def opponent(self, p):
+        return self.players[1] if p == self.players[0] else self.players[0]
+
+    def place(self, c, p):
+        q = self.opponent(p)
+        self.cells[c] = p
+        self.hash ^= self.zobrist[p][c]
+        own, other = self.counts[p], self.counts[q]
+        for i in self.cell_windows[c]:
+            if other[i] == 0:
+                self.live[p][own[i]].discard(i)
+                self.live[p][own[i] + 1].add(i)
+            elif own[i] == 0:
+                self.live[q][other[i]].discard(i)
+            own[i] += 1
+
+    def remove(self, c):
+        p = self.cells[c]
+        q = self.opponent(p)
+        self.cells[c] = 0
+        self.hash ^= self.zobrist[p][c]
+        own, other = self.counts[p], self.counts[q]
+        for i in self.cell_windows[c]:
+            own[i] -= 1
+            if other[i] == 0:
+                self.live[p][own[i] + 1].discard(i)
+                self.live[p][own[i]].add(i)
+            elif own[i] == 0:
+                self.live[q][other[i]].add(i)
+
+    def _empty_cells(self, windows):
+        cells = self.cells
+        return {c for i in windows for c in self.windows[i] if cells[c] == 0}
+
+    def win_cells(self, p):
+        """The cells completing a run of p."""
+        return self._empty_cells(self.live[p][self.n - 1])
+
+    def four_moves(self, p):
+        """The moves making a four of p."""
+        return self._empty_cells(self.live[p][self.n - 2]) if self.n >= 2 else set()
+
+    def open_four_moves(self, p):
+        """The moves making at least two winning cells of p at once."""
+        if self.n < 2:
+            return []
+        cells = self.cells
+        win = self.win_cells(p)
+        # a move in a window one stone short of a four makes the other empty cell a winning cell
+        new_wins = {}
+        for i in self.live[p][self.n - 2]:
+            a, b = [c for c in self.windows[i] if cells[c] == 0]
+            new_wins.setdefault(a, set()).add(b)
+            new_wins.setdefault(b, set()).add(a)
+        return [c for c, wins in new_wins.items() if len((wins | win) - {c}) >= 2]
+
+    def three_moves(self, p):
+        """The moves that are not fours but after which p can make an open four."""
+        if self.n < 3:
+            return []
+        fours = self.four_moves(p)
+        moves = []
+        for c in self._empty_cells(self.live[p][self.n - 3]) - fours:
+            self.place(c, p)
+            if self.open_four_moves(p):
+                moves.append(c)
+            self.remove(c)
+        return moves
+
+    def three_defenses(self, p):
+        """
+        The moves of p's opponent after which p can no longer make an open four.
+        Open fours are made in windows two stones short of a win, so only their empty
+        cells can be defenses.
+        """
+        q = self.opponent(p)
+        candidates = self._empty_cells(self.live[p][self.n - 2])
+        defenses = []
+        for c in candidates:
+            self.place(c, q)
+            if not self.open_four_moves(p):
+                defenses.append(c)
+            self.remove(c)
+        return defenses
+
+
+class ThreatSearch(object):
+    """
+    Proves forced wins with threat-space search: the attacker only plays threats
+    (fours, and threes when searching VCT), so the defender's replies are limited to
+    the cells that stop them and the defender's own fours.
+    """
+
+    def __init__(self, max_depth=10, vct_depth=3, max_nodes=1000):
+        """
+        Parameters:
+            max_depth: the maximum number of attacker moves in a victory by continuous
+                fours (VCF).
+            vct_depth: the maximum number of attacker moves in a victory by continuous
+                fours and threes (VCT), 0 to only search VCF.
+            max_nodes: the number of attacker positions after which a search gives up.
+        """
+        self.max_depth = max_depth
+        self.vct_depth = vct_depth
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.space = None
+        self.cache = {}
+
+    def attack(self, p, depth, use_threes):
+        """Return a move starting a forced win of p (to move) within depth moves, or None."""
+        space = self.space
+        win = space.win_cells(p)
+        if win:
+            return min(win)
+        if depth == 0 or self.nodes >= self.max_nodes:
+            return None
+        key = (space.hash, p, depth, use_threes)
+        if key in self.cache:
+            return self.cache[key]
+        self.nodes += 1
+        q = space.opponent(p)
+        blocks = space.win_cells(q)
+        if len(blocks) >= 2:
+            moves = []
+        elif blocks:
+            # p must block and keep the initiative with the same move
+            moves = list(blocks)
+        else:
+            moves = sorted(space.four_moves(p))
+            if use_threes:
+                moves += sorted(space.three_moves(p))
+        result = None
+        for c in moves:
+            space.place(c, p)
+            threatens = bool(space.win_cells(p)) or (use_threes and space.open_four_moves(p))
+            if threatens and self.defend(p, depth, use_threes):
+                result = c
+            space.remove(c)
+            if result is not None:
+                break
+        self.cache[key] = result
+        return result
+
+    def defend(self, p, depth, use_threes):
+        """Whether every reply of p's opponent to p's threat leads to a forced win of p."""
+        space = self.space
+        q = space.opponent(p)
+        if space.win_cells(q):
+            return False
+        win = space.win_cells(p)
+        if len(win) >= 2:
+            return True
+        if win:
+            replies = list(win)
+        else:
+            replies = set(space.three_defenses(p)) | space.four_moves(q)
+        for c in sorted(replies):
+            space.place(c, q)
+            refuted = self.attack(p, depth - 1, use_threes) is None
+            space.remove(c)
+            if refuted:
+                return False
+        return True
+
+    def find_win(self, state: State, player=None):
+        """
+        Return a move starting a forced win of player (the player to move by default)
+        by continuous fours, then by fours and threes, or None.
+        """
+        self.space = ThreatSpace(state)
+        self.nodes = 0
+        self.cache = {}
+        if player is None:
+            player = state.get_current_player()
+        move = self.attack(player, self.max_depth, False)
+        if move is None and self.vct_depth > 0:
+            move = self.attack(player, self.vct_depth, True)
+        return move
+
+    def find_forced_move(self, state: State):
+        """
+        Return the move to play at once in state, or None to leave it to a full search:
+        a winning move, the block of an opponent's winning cell, the start of a forced
+        win, or the only move stopping the opponent's open four.
+        """
+        player = state.get_current_player()
+        self.nodes = 0
+        space = self.space = ThreatSpace(state)
+        opponent = space.opponent(player)
+        win = space.win_cells(player)
+        if win:
+            return min(win)
+        blocks = space.win_cells(opponent)
+        if blocks:
+            return min(blocks)
+        move = self.find_win(state)
+        if move is not None:
+            return move
+        space = self.space = ThreatSpace(state)
+        if space.open_four_moves(opponent):
+            defenses = space.three_defenses(opponent)
+            if len(defenses) == 1:
+                return defenses[0]
+        return None
@@ -0,0 +1,90 @@
+"""
+Transposition table for alpha-beta search
+"""
+
+# kinds of values stored in the table
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable(object):
+    """
+    A fixed number of slots holding search results keyed by position hash.
+
+    Each slot keeps one entry (key, depth, value, flag, move, generation). A new entry
+    replaces the old one only if it was searched at least as deep, or if the old one
+    belongs to the search of an earlier move (depth-preferred replacement with aging).
+    """
+
+    def __init__(self, size=1 << 18):
+        """
+        Parameters:
+            size: the number of slots.
+        """
+        self.size = size
+        self.generation = 0
+        self._slots = [None] * size
+
+    def clear(self):
+        self._slots = [None] * self.size
+
+    def new_search(self):
+        """Mark entries stored so far as old, so that they are replaced first."""
+        self.generation += 1
+
+    def lookup(self, key, depth, alpha, beta):
+        """
+        Use a stored result to narrow the window (alpha, beta) of a search.
+
+        Parameters:
+            key: the hash of the position.
+            depth: the remaining search depth, shallower entries give no bound.
+            alpha, beta: the current search window.
+
+        Return:
+            Tuple(value, move, alpha, beta): value is not None if the stored result
+            settles the node; move is the stored best move (if exists).
+        """
+        entry = self._slots[key % self.size]
+        if entry is None or entry[0] != key:
+            return None, None, alpha, beta
+        _, entry_depth, value, flag, move, _ = entry
+        if entry_depth >= depth:
+            if flag == EXACT:
+                return value, move, alpha, beta
+            elif flag == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value, move, alpha, beta
+        return None, move, alpha, beta
+
+    def get_move(self, key):
+        """Return the best move stored for the position, or None."""
+        entry = self._slots[key % self.size]
+        if entry is None or entry[0] != key:
+            return None
+        return entry[4]
+
+    def store(self, key, depth, value, alpha, beta, move):
+        """
+        Store the result of a search run with the window (alpha, beta).
+
+        Parameters:
+            key: the hash of the position.
+            depth: the remaining search depth.
+            value: the value found by the search.
+            alpha, beta: the window the search started with, used to tell
+                exact values from bounds.
+            move: the best move found.
+        """
+        if value <= alpha:
+            flag = UPPER
+        elif value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        slot = key % self.size
+        entry = self._slots[slot]
+        if entry is None or depth >= entry[1] or entry[5] != self.generation:
+            self._slots[slot] = (key, depth, value, flag, move, self.generation)
@@ -0,0 +1,191 @@
+"""
+Value network evaluating positions for the player to move, trained on self-play records
+"""
+from __future__ import print_function
+
+import os
+import sys
+
+import numpy as np
+from game import State, symmetry_table
+from rollout import window_table
+from selfplay import load_records, load_meta
+
+# the joelnet package of this repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "joelnet"))
+from joelnet.nn import NeuralNet
+from joelnet.layers import Linear, Tanh
+from joelnet.train import train
+from joelnet.data import BatchIterator
+from joelnet.optim import SGD
+
+DEFAULT_WEIGHTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "value_net.npz")
+
+
+class ValueNet(object):
+    """
+    A multilayer perceptron returning the value of a position in [-1, 1] in the perspective
+    of the player to move, like the evaluation functions.
+
+    Its inputs are, for the player to move and for the opponent, the number of live windows
+    (runs of n_in_row cells free of the other player's stones) holding k of the player's
+    stones, for k from 1 to n_in_row - 1. They are counted for a whole batch with a few
+    array operations, and generalize from far fewer games than the raw board.
+    """
+
+    def __init__(self, width, height, n_in_row, hidden_size=16):
+        """
+        Parameters:
+            width, height, n_in_row: the board.
+            hidden_size: the number of units of the hidden layer.
+        """
+        self.width = width
+        self.height = height
+        self.n_in_row = n_in_row
+        self.hidden_size = hidden_size
+        self.windows = window_table(width, height, n_in_row)
+        n_inputs = 2 * (n_in_row - 1)
+        self.net = NeuralNet([Linear(n_inputs, hidden_size), Tanh(), Linear(hidden_size, 1), Tanh()])
+        # joelnet draws weights from N(0, 1), scale them so that the units do not saturate at first
+        for layer, fan_in in ((self.net.layers[0], n_inputs), (self.net.layers[2], hidden_size)):
+            layer.params["w"] /= np.sqrt(fan_in)
+            layer.params["b"] *= 0
+
+    def features(self, boards, players):
+        """
+        The inputs of the network for an array of boards (pieces indexed by move, one board
+        per row) and the array of the players to move.
+        """
+        boards = np.asarray(boards)
+        players = np.asarray(players).reshape(-1, 1)
+        own = boards == players
+        opponent = (boards != 0) & ~own
+        # stones of each player in every window, shape (batch, n_windows)
+        own_counts = own[:, self.windows].sum(axis=2)
+        opponent_counts = opponent[:, self.windows].sum(axis=2)
+        features = []
+        for k in range(1, self.n_in_row):
+            features.append(np.sum((own_counts == k) & (opponent_counts == 0), axis=1))
+            features.append(np.sum((opponent_counts == k) & (own_counts == 0), axis=1))
+        return np.log1p(np.stack(features, axis=1).astype(np.float64))
+
+    def forward(self, boards, players):
+        return self.net.forward(self.features(boards, players))[:, 0]
+
+    def check_board(self, state: State):
+        """Raise a ValueError if state is not on the board the network was built for."""
+        board = (state._width, state._height, state._n_in_row)
+        if board != (self.width, self.height, self.n_in_row):
+            raise ValueError(
+                "the value network is trained for {}x{} boards with {} in a row, not {}x{} with {}: "
+                "generate records on this board with selfplay.py and train weights for it with "
+                "value_net.py, then pass them with --value_net_weights".format(
+                    self.width, self.height, self.n_in_row, *board))
+
+    def __call__(self, state: State):
+        """Evaluate one state, as an evaluation function."""
+        self.check_board(state)
+        return float(self.forward(state.to_array().reshape(1, -1), [state.get_current_player()])[0])
+
+    def evaluate_batch(self, states):
+        """Evaluate a list of states in one forward pass, returning an array."""
+        self.check_board(states[0])
+        boards = np.stack([s.to_array().reshape(-1) for s in states])
+        return self.forward(boards, [s.get_current_player() for s in states])
+
+    def fit(self, records, n_epochs=10, batch_size=64, lr=1e-3, augment=True):
+        """
+        Train the network with joelnet to predict the final result of the records
+        (see selfplay.record_dtype).
+
+        Parameters:
+            augment: also train on the images of the records by every symmetry of the board.
+        """
+        boards, players, results = records["board"], records["player"], records["result"]
+        if augment:
+            images = []
+            for perm, inverse in symmetry_table(self.width, self.height):
+                image = np.empty_like(boards)
+                image[:, perm] = boards
+                images.append(image)
+            boards = np.concatenate(images)
+            players = np.tile(players, len(images))
+            results = np.tile(results, len(images))
+        order = np.random.permutation(len(boards))
+        inputs = self.features(boards[order], players[order])
+        targets = results[order].reshape(-1, 1).astype(np.float64)
+        train(self.net, inputs, targets, num_epochs=n_epochs, iterator=BatchIterator(batch_size),
+              optimizer=SGD(lr))
+
+    def save(self, path):
+        params = {"width": self.width, "height": self.height, "n_in_row": self.n_in_row,
+                  "hidden_size": self.hidden_size}
+        for i, layer in enumerate(self.net.layers):
+            for name, param in layer.params.items():
+                params["{}_{}".format(name, i)] = param
+        np.savez(path, **params)
+
+    @staticmethod
+    def load(path):
+        params = np.load(path)
+        value_net = ValueNet(int(params["width"]), int(params["height"]), int(params["n_in_row"]),
+                             int(params["hidden_size"]))
+        for i, layer in enumerate(value_net.net.layers):
+            for name in layer.params:
+                layer.params[name] = params["{}_{}".format(name, i)]
+        return value_net
+
+
+_value_nets = {}
+
+
+def load_value_net(path=None):
+    """Return the ValueNet saved in path (DEFAULT_WEIGHTS if None), loaded once per process."""
+    if path is None:
+        path = DEFAULT_WEIGHTS
+    if path not in _value_nets:
+        _value_nets[path] = ValueNet.load(path)
+    return _value_nets[path]
+
+
+def split_records(records, validation):
+    """Split records by game, every game going to the validation set with probability validation."""
+    games = np.unique(records["game"])
+    rng = np.random.RandomState(0)
+    validation_games = games[rng.rand(len(games)) < validation]
+    is_validation = np.isin(records["game"], validation_games)
+    return records[~is_validation], records[is_validation]
+
+
+def run(args):
+    np.random.seed(args.seed)
+    meta = load_meta(args.data)
+    records = load_records(args.data)
+    train_records, validation_records = split_records(records, args.validation)
+    print("{} training and {} validation positions".format(len(train_records), len(validation_records)))
+    value_net = ValueNet(meta["width"], meta["height"], meta["n_in_row"], args.hidden_size)
+    value_net.fit(train_records, args.n_epochs, args.batch_size, args.lr, not args.no_augment)
+    for name, r in (("training", train_records), ("validation", validation_records)):
+        if len(r) > 0:
+            values = value_net.forward(r["board"], r["player"])
+            print("{} MSE {:.4f}, sign accuracy {:.3f}".format(
+                name, np.mean((values - r["result"]) ** 2), np.mean(np.sign(values) == r["result"])))
+    value_net.save(args.output)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type=str, default="selfplay", help="Directory of the self-play records (selfplay.py --output).")
+    parser.add_argument("--output", type=str, default=DEFAULT_WEIGHTS, help="File to save the weights to (npz).")
+    parser.add_argument("--hidden_size", type=int, default=16, help="Units of the hidden layer.")
+    parser.add_argument("--n_epochs", type=int, default=10, help="Passes over the training positions.")
+    parser.add_argument("--batch_size", type=int, default=64, help="Positions per gradient step.")
+    parser.add_argument("--lr", type=float, default=1e-3, help="Learning rate of SGD (on the summed squared error of a batch).")
+    parser.add_argument("--validation", type=float, default=0.1, help="Fraction of the games held out for validation.")
+    parser.add_argument("--no_augment", action="store_true", help="Do not train on the symmetric images of the positions.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the initial weights and of the order of the positions.")
+    args = parser.parse_args()
+
+    run(args)